@@ -0,0 +1,215 @@
+"""
+Response cache for the /refactor endpoint.
+Entries are content-addressed: the key is a hash of the normalized code plus
+everything else that changes what the model returns (language, model,
+temperature and prompt template).
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_code(code):
+    """Ignore differences that don't change the program: line endings,
+    trailing whitespace and surrounding blank lines."""
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def make_cache_key(code, language, model, temperature, prompt_template):
+    payload = json.dumps(
+        [
+            normalize_code(code),
+            language.strip().lower(),
+            model,
+            temperature,
+            prompt_template,
+        ]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.latency_saved = 0.0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+        }
+
+
+class LRUCache:
+    """
+    In-process tier. Evicts the least recently used entry when either the
+    entry count or the total payload size goes over its limit, and drops
+    entries older than `ttl` seconds on access.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, ttl=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value, latency)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value, latency = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value, latency
+
+    def set(self, key, value, latency, ttl=None):
+        size = sum(len(part.encode("utf-8")) for part in value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (expires_at, size, value, latency)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class SQLiteCache:
+    """On-disk tier so cached refactors survive restarts."""
+
+    def __init__(self, path, ttl=7 * 24 * 3600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS refactor_cache ("
+            " key TEXT PRIMARY KEY,"
+            " refactored_code TEXT NOT NULL,"
+            " explanation TEXT NOT NULL,"
+            " latency REAL NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT refactored_code, explanation, latency, expires_at"
+                " FROM refactor_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[3] < time.time():
+                self._conn.execute("DELETE FROM refactor_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return (row[0], row[1]), row[2]
+
+    def set(self, key, value, latency):
+        refactored_code, explanation = value
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO refactor_cache VALUES (?, ?, ?, ?, ?)",
+                (key, refactored_code, explanation, latency, time.time() + self.ttl),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM refactor_cache")
+            self._conn.commit()
+
+
+class RefactorCache:
+    """
+    Two-tier cache: memory first, then (optionally) SQLite. A disk hit is
+    promoted into memory. Values are (refactored_code, explanation) tuples and
+    `latency` is how long the upstream call took, so every hit can be credited
+    with the time it saved.
+    """
+
+    def __init__(self, memory=None, disk=None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.disk = disk
+        self.stats = CacheStats()
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            return self._found(key, entry, from_disk=False)
+        if self.disk is not None:
+            return self._found(key, self.disk.get(key), from_disk=True)
+        return self._found(key, None, from_disk=False)
+
+    async def aget(self, key):
+        """get() for async code: the SQLite tier runs on a worker thread."""
+        entry = self.memory.get(key)
+        if entry is not None:
+            return self._found(key, entry, from_disk=False)
+        if self.disk is not None:
+            return self._found(key, await asyncio.to_thread(self.disk.get, key), from_disk=True)
+        return self._found(key, None, from_disk=False)
+
+    def _found(self, key, entry, from_disk):
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        if from_disk:
+            self.stats.disk_hits += 1
+            self.memory.set(key, *entry)
+        else:
+            self.stats.memory_hits += 1
+        value, latency = entry
+        self.stats.hits += 1
+        self.stats.latency_saved += latency
+        return value
+
+    def set(self, key, value, latency):
+        self.memory.set(key, value, latency)
+        if self.disk is not None:
+            self.disk.set(key, value, latency)
+
+    async def aset(self, key, value, latency):
+        """set() for async code: the SQLite write and commit run on a worker thread."""
+        self.memory.set(key, value, latency)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, latency)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
@@ -0,0 +1,61 @@
+"""
+Split Python source into chunks at top-level function and class boundaries,
+so a large file can be refactored piece by piece and reassembled in order.
+"""
+
+import ast
+from dataclasses import dataclass
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+@dataclass
+class Chunk:
+    name: str  # function/class name, or "<module>" for code between definitions
+    source: str
+    start_line: int
+    end_line: int
+
+    @property
+    def is_definition(self):
+        return self.name != "<module>"
+
+
+def _definition_start(node, lines):
+    """First line of a definition, including its decorators and any comment
+    block directly above it."""
+    start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+    while start > 1 and lines[start - 2].lstrip().startswith("#"):
+        start -= 1
+    return start
+
+
+def split_python_source(code):
+    """
+    Return the chunks of `code` in order. Definitions get a chunk each; the
+    statements between them (imports, constants, `if __name__ == ...`) are
+    grouped into "<module>" chunks. Raises SyntaxError for invalid source.
+    """
+    tree = ast.parse(code)
+    lines = code.splitlines(keepends=True)
+
+    def make_chunk(name, start, end):
+        source = "".join(lines[start - 1 : end]).strip("\n")
+        return Chunk(name, source, start, end) if source.strip() else None
+
+    chunks = []
+    line = 1
+    for node in tree.body:
+        if not isinstance(node, _DEFINITIONS):
+            continue
+        start = max(_definition_start(node, lines), line)
+        chunks.append(make_chunk("<module>", line, start - 1))
+        chunks.append(make_chunk(node.name, start, node.end_lineno))
+        line = node.end_lineno + 1
+    chunks.append(make_chunk("<module>", line, len(lines)))
+    return [chunk for chunk in chunks if chunk is not None]
+
+
+def join_chunks(sources):
+    """Reassemble chunk sources with PEP 8 spacing between top-level blocks."""
+    return "\n\n\n".join(source.strip("\n") for source in sources) + "\n"
@@ -0,0 +1,92 @@
+"""
+Local stand-in for AsyncOpenAI.
+Implements just enough of `chat.completions.create` (plain and `stream=True`)
+for myapp.py, with a configurable delay, and counts the upstream calls it
+receives so request coalescing and caching can be checked without an API key:
+
+    import myapp
+    from fake_openai import FakeAsyncOpenAI
+
+    myapp.aclient = FakeAsyncOpenAI(latency=0.5)
+
+Or start the whole app against it: REFACTOR_FAKE_OPENAI=1 uvicorn myapp:app
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+DEFAULT_REPLY = (
+    "```python\nfor item in arr:\n    print(item)\n```\n"
+    "Used direct iteration over the list for better readability and efficiency."
+)
+
+
+class _FakeRawResponse:
+    """What `with_raw_response.create` returns: headers plus parse()."""
+
+    def __init__(self, parsed, headers):
+        self.headers = headers
+        self._parsed = parsed
+
+    def parse(self):
+        return self._parsed
+
+
+class _FakeCompletions:
+    def __init__(self, client):
+        self._client = client
+        self.with_raw_response = SimpleNamespace(create=self._create_raw)
+
+    async def _create_raw(self, **kwargs):
+        return _FakeRawResponse(await self.create(**kwargs), self._client.headers)
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        self._client.calls += 1
+        self._client.requests.append({"model": model, "messages": messages, **kwargs})
+        if stream:
+            return self._stream(model)
+        await asyncio.sleep(self._client.latency)
+        content = self._client.reply
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        return SimpleNamespace(
+            model=model,
+            choices=[
+                SimpleNamespace(
+                    index=0,
+                    finish_reason="stop",
+                    message=SimpleNamespace(role="assistant", content=content),
+                )
+            ],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=len(content) // 4,
+                total_tokens=prompt_tokens + len(content) // 4,
+            ),
+        )
+
+    async def _stream(self, model):
+        # Spread the latency over the reply, a few characters per chunk
+        content = self._client.reply
+        pieces = [content[i : i + 4] for i in range(0, len(content), 4)]
+        for piece in pieces:
+            await asyncio.sleep(self._client.latency / len(pieces))
+            yield SimpleNamespace(
+                model=model,
+                choices=[
+                    SimpleNamespace(
+                        index=0,
+                        finish_reason=None,
+                        delta=SimpleNamespace(role="assistant", content=piece),
+                    )
+                ],
+            )
+
+
+class FakeAsyncOpenAI:
+    def __init__(self, latency=0.2, reply=DEFAULT_REPLY):
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+        self.requests = []
+        self.headers = {}  # e.g. x-ratelimit-remaining-requests, for the gateway
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
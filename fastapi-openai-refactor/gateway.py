@@ -0,0 +1,327 @@
+"""
+Upstream gateway for the OpenAI client used by myapp.py.
+Every chat completion goes through one shared UpstreamGateway, which
+  * queues requests behind request- and token-per-minute buckets that adapt to
+    the x-ratelimit-* headers OpenAI sends back,
+  * retries 429s, timeouts and 5xx errors with jittered exponential backoff,
+    limited by a retry budget so retries can't multiply load during an outage,
+  * opens a circuit breaker after repeated failures so callers fail fast.
+"""
+
+import asyncio
+import random
+import re
+import time
+from collections import deque
+
+import openai
+from openai import DEFAULT_CONNECTION_LIMITS, DefaultAsyncHttpxClient, Timeout
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream can't take the request right now; try again later."""
+
+    def __init__(self, detail, retry_after=1.0):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def make_http_client(max_connections=100, max_keepalive=20, timeout=60.0):
+    """Pooled keep-alive HTTP client to hand to AsyncOpenAI(http_client=...)."""
+    # Build Limits from the HTTP library the installed openai client is built on
+    limits_type = type(DEFAULT_CONNECTION_LIMITS)
+    return DefaultAsyncHttpxClient(
+        limits=limits_type(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=30.0,
+        ),
+        timeout=Timeout(timeout, connect=5.0),
+    )
+
+
+def parse_reset(value):
+    """Parse OpenAI reset durations such as "20ms", "1s" or "6m0s" into seconds."""
+    if not value:
+        return None
+    seconds = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|s|m|h)", value):
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+
+class TokenBucket:
+    """
+    `capacity` units per minute, refilled continuously. Callers ask how long
+    to wait for `amount` units rather than being refused.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.capacity / 60
+        )
+        self.updated = now
+        return now
+
+    def wait_time(self, amount):
+        now = self._refill()
+        amount = min(amount, self.capacity)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < amount:
+            wait = max(wait, (amount - self.tokens) * 60 / self.capacity)
+        return wait
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adapt(self, limit=None, remaining=None, reset=None):
+        """Trust the server's view of our quota over our own estimate."""
+        self._refill()
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.tokens = min(self.tokens, float(remaining))
+            if remaining <= 0 and reset:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + reset)
+
+    def pause(self, seconds):
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RetryBudget:
+    """
+    Allow retries only while they stay under `ratio` of recent requests (plus
+    a small floor so a quiet service can still retry). Counts over a sliding
+    window of `window` seconds.
+    """
+
+    def __init__(self, ratio=0.2, min_retries=10, window=10.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+
+    def _trim(self, now):
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def record_request(self):
+        self._requests.append(time.monotonic())
+
+    def try_retry(self):
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+            return False
+        self._retries.append(now)
+        return True
+
+
+class CircuitBreaker:
+    """
+    closed: requests flow. After `failure_threshold` consecutive failures the
+    breaker opens and rejects requests for `reset_timeout` seconds, then lets
+    a single probe through (half-open) to decide whether to close again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._probing = False
+
+    def check(self):
+        """Fail fast while open, without claiming the half-open probe."""
+        if self.state == "open":
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise UpstreamUnavailable(
+                    "Upstream circuit breaker is open.", retry_after=remaining
+                )
+
+    def before_request(self):
+        self.check()
+        if self.state == "open":
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                raise UpstreamUnavailable(
+                    "Upstream circuit breaker is half-open.", retry_after=1.0
+                )
+            self._probing = True
+
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+        self._probing = False
+
+    def release(self):
+        """The request never reached the upstream, so it proves nothing."""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class UpstreamGateway:
+    def __init__(
+        self,
+        requests_per_minute=500,
+        tokens_per_minute=30000,
+        max_retries=4,
+        backoff_base=0.5,
+        backoff_cap=20.0,
+        max_queue_wait=30.0,
+        retry_budget=None,
+        circuit_breaker=None,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_queue_wait = max_queue_wait
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breaker = circuit_breaker or CircuitBreaker()
+        self.queued = 0
+        self.retries = 0
+        self.rejected = 0
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def estimate_tokens(kwargs):
+        # ~4 characters per token for the prompt, plus the completion we asked for
+        prompt = sum(len(m.get("content") or "") for m in kwargs.get("messages", []))
+        return prompt // 4 + kwargs.get("max_tokens", 0)
+
+    async def _acquire(self, tokens):
+        """Wait in line for quota. The lock keeps the queue FIFO."""
+        deadline = time.monotonic() + self.max_queue_wait
+        self.queued += 1
+        try:
+            async with self._lock:
+                while True:
+                    wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                    if wait <= 0:
+                        break
+                    if time.monotonic() + wait > deadline:
+                        self.rejected += 1
+                        raise UpstreamUnavailable(
+                            "Upstream rate limit queue is full.", retry_after=wait
+                        )
+                    await asyncio.sleep(wait)
+                self.requests.take(1)
+                self.tokens.take(tokens)
+        finally:
+            self.queued -= 1
+
+    def _adapt(self, headers):
+        def number(name):
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        self.requests.adapt(
+            limit=number("x-ratelimit-limit-requests"),
+            remaining=number("x-ratelimit-remaining-requests"),
+            reset=parse_reset(headers.get("x-ratelimit-reset-requests")),
+        )
+        self.tokens.adapt(
+            limit=number("x-ratelimit-limit-tokens"),
+            remaining=number("x-ratelimit-remaining-tokens"),
+            reset=parse_reset(headers.get("x-ratelimit-reset-tokens")),
+        )
+
+    def _backoff(self, attempt, exc):
+        retry_after = None
+        response = getattr(exc, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after", ""))
+            except ValueError:
+                retry_after = None
+        # Full jitter keeps a burst of failed requests from retrying in lockstep
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempt))
+        return max(delay, retry_after or 0.0)
+
+    async def chat_completion(self, client, **kwargs):
+        """
+        Call client.chat.completions.create(**kwargs) under the gateway's
+        limits. With stream=True the retries only cover opening the stream.
+        """
+        estimated = self.estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            self.breaker.check()
+            await self._acquire(estimated)
+            self.breaker.before_request()
+            self.retry_budget.record_request()
+            try:
+                raw = await client.chat.completions.with_raw_response.create(**kwargs)
+            except RETRYABLE_ERRORS as exc:
+                response = getattr(exc, "response", None)
+                if response is not None:
+                    self._adapt(response.headers)
+                delay = self._backoff(attempt, exc)
+                if isinstance(exc, openai.RateLimitError):
+                    # Quota, not an outage: slow everyone down but leave the breaker alone
+                    self.requests.pause(delay)
+                    self.breaker.release()
+                else:
+                    self.breaker.record_failure()
+                if attempt >= self.max_retries or not self.retry_budget.try_retry():
+                    raise UpstreamUnavailable(
+                        f"Upstream request failed: {type(exc).__name__}",
+                        retry_after=max(delay, 1.0),
+                    ) from exc
+                self.retries += 1
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except openai.APIStatusError:
+                # A 4xx means the upstream is up and answering; the request was bad
+                self.breaker.record_success()
+                raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            self._adapt(raw.headers)
+            return raw.parse()
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "circuit": self.breaker.state,
+            "requests_available": round(self.requests.tokens, 1),
+            "tokens_available": round(self.tokens.tokens, 1),
+        }
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Load test for myapp.py against the mock OpenAI server.
+Starts mock_openai_server.py and the app under uvicorn, drives the app either
+at a fixed request rate (open loop) or with a fixed number of concurrent
+clients (closed loop), and prints throughput, latency percentiles and error
+rates as JSON so runs can be compared across commits.
+
+    python loadtest.py --mode open --rps 50 --duration 30 --output before.json
+    python loadtest.py --mode closed --concurrency 64 --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_CODE = "for i in range(len(arr)): print(arr[i])"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_servers(args):
+    """Start the mock upstream and the app; returns (app_url, processes)."""
+    mock_port, app_port = free_port(), free_port()
+    mock = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(HERE, "mock_openai_server.py"),
+            "--port", str(mock_port),
+            "--latency", str(args.mock_latency),
+            "--jitter", str(args.mock_jitter),
+            "--error-rate", str(args.mock_error_rate),
+        ],  # fmt: skip
+        cwd=HERE,
+    )
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "loadtest",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+        # Don't let the gateway's default quotas throttle the benchmark
+        "OPENAI_RPM_LIMIT": os.getenv("OPENAI_RPM_LIMIT", "1000000"),
+        "OPENAI_TPM_LIMIT": os.getenv("OPENAI_TPM_LIMIT", "1000000000"),
+    }
+    env.pop("REFACTOR_FAKE_OPENAI", None)
+    app = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "myapp:app",
+            "--host", "127.0.0.1",
+            "--port", str(app_port),
+            "--workers", str(args.workers),
+            "--log-level", "warning",
+        ],  # fmt: skip
+        cwd=HERE,
+        env=env,
+    )
+    processes = [mock, app]
+    try:
+        wait_until_ready(f"http://127.0.0.1:{mock_port}/health", mock)
+        wait_until_ready(f"http://127.0.0.1:{app_port}/metrics", app)
+    except Exception:
+        stop_servers(processes)
+        raise
+    return f"http://127.0.0.1:{app_port}", processes
+
+
+def stop_servers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def make_payload(index, args, unique_ratio=None):
+    code = SAMPLE_CODE
+    # Unique payloads miss the response cache and coalescing
+    if random.random() < (args.unique_ratio if unique_ratio is None else unique_ratio):
+        code += f"  # request {index}"
+    if args.endpoint.endswith("/batch"):
+        return {"items": [{"code": code, "language": "python"}]}
+    return {"code": code, "language": "python"}
+
+
+async def send(client, index, args, scheduled, results):
+    """Append (latency, status, item statuses or None) for one HTTP request."""
+    payload = make_payload(index, args)
+    items = None
+    try:
+        response = await client.post(args.endpoint, json=payload)
+        await response.aread()
+        status = response.status_code
+        # A batch answers 200 even when its items failed, so keep each item's status
+        if status == 200 and args.endpoint.endswith("/batch"):
+            items = [item["status_code"] for item in response.json()["results"]]
+    except httpx.HTTPError as exc:
+        status = type(exc).__name__
+    # Measured from when the request was due, so a backed-up client can't hide
+    # latency (coordinated omission)
+    results.append((time.perf_counter() - scheduled, status, items))
+
+
+async def run_open_loop(client, args, results):
+    """Send at a fixed rate whether or not earlier requests have finished."""
+    interval = 1.0 / args.rps
+    started = time.perf_counter()
+    tasks = []
+    index = 0
+    while True:
+        scheduled = started + index * interval
+        if scheduled - started >= args.duration:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(client, index, args, scheduled, results)))
+        index += 1
+    await asyncio.gather(*tasks)
+
+
+async def run_closed_loop(client, args, results):
+    """Each of `concurrency` clients sends its next request when the last returns."""
+    deadline = time.perf_counter() + args.duration
+    counter = iter(range(sys.maxsize))
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await send(client, next(counter), args, time.perf_counter(), results)
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(results, elapsed):
+    latencies = sorted(latency for latency, status, _ in results if status == 200)
+    statuses = Counter(str(status) for _, status, _ in results)
+    errors = len(results) - statuses.get("200", 0)
+    item_statuses = Counter(
+        str(status) for _, _, items in results if items is not None for status in items
+    )
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    report = {
+        "requests": len(results),
+        "duration_seconds": round(elapsed, 3),
+        "throughput_rps": round(statuses.get("200", 0) / elapsed, 2) if elapsed else 0,
+        "error_rate": round(errors / len(results), 4) if results else 0,
+        "status_counts": dict(statuses),
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "max": ms(latencies[-1] if latencies else None),
+            "mean": ms(sum(latencies) / len(latencies) if latencies else None),
+        },
+    }
+    if item_statuses:
+        # Latency above is per HTTP request; batch items only add error counts
+        item_count = sum(item_statuses.values())
+        report["batch_items"] = {
+            "items": item_count,
+            "error_rate": round((item_count - item_statuses.get("200", 0)) / item_count, 4),
+            "status_counts": dict(item_statuses),
+        }
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HERE,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args, app_url):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(
+        base_url=app_url, limits=limits, timeout=args.timeout
+    ) as client:
+        # One warm-up request so process start-up isn't counted
+        await client.post(args.endpoint, json=make_payload(-1, args, unique_ratio=0.0))
+        results = []
+        started = time.perf_counter()
+        if args.mode == "open":
+            await run_open_loop(client, args, results)
+        else:
+            await run_closed_loop(client, args, results)
+        return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the refactor service.")
+    parser.add_argument("--mode", choices=["open", "closed"], default="open")
+    parser.add_argument("--rps", type=float, default=20, help="open loop rate")
+    parser.add_argument("--concurrency", type=int, default=16, help="closed loop clients")
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--endpoint", default="/refactor")
+    parser.add_argument(
+        "--unique-ratio",
+        type=float,
+        default=1.0,
+        help="share of requests with unique code (1.0 = no cache hits)",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--mock-latency", type=float, default=0.5)
+    parser.add_argument("--mock-jitter", type=float, default=0.1)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--app-url", help="benchmark an already running app instead of starting one"
+    )
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    processes = []
+    app_url = args.app_url
+    if app_url is None:
+        app_url, processes = start_servers(args)
+    try:
+        results, elapsed = asyncio.run(run(args, app_url))
+    finally:
+        stop_servers(processes)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        **summarize(results, elapsed),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
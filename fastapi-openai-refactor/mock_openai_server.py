@@ -0,0 +1,120 @@
+"""
+Mock OpenAI chat completions server for benchmarking myapp.py.
+Answers POST /v1/chat/completions (plain and stream=True) with a canned
+refactor after a configurable delay, so load tests measure our service rather
+than OpenAI. Point the app at it with OPENAI_BASE_URL:
+
+    python mock_openai_server.py --port 9000 --latency 0.8 --jitter 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=x uvicorn myapp:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from fake_openai import DEFAULT_REPLY
+
+app = FastAPI()
+app.state.latency = 0.5
+app.state.jitter = 0.1
+app.state.error_rate = 0.0
+app.state.reply = DEFAULT_REPLY
+
+
+def _delay():
+    # Normal jitter around the mean latency, never negative
+    return max(0.0, random.gauss(app.state.latency, app.state.jitter))
+
+
+def _usage(messages, content):
+    prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+async def _stream(body, delay):
+    content = app.state.reply
+    pieces = [content[i : i + 4] for i in range(0, len(content), 4)]
+    base = {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+    }
+    for piece in pieces:
+        await asyncio.sleep(delay / len(pieces))
+        chunk = {
+            **base,
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    if (body.get("stream_options") or {}).get("include_usage"):
+        chunk = {**base, "choices": [], "usage": _usage(body["messages"], content)}
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    delay = _delay()
+    if random.random() < app.state.error_rate:
+        await asyncio.sleep(delay)
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": "Mock upstream error", "type": "server_error"}},
+        )
+
+    if body.get("stream"):
+        return StreamingResponse(_stream(body, delay), media_type="text/event-stream")
+
+    await asyncio.sleep(delay)
+    content = app.state.reply
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": _usage(body["messages"], content),
+    }
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="stddev seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="0.0 - 1.0")
+    args = parser.parse_args()
+
+    app.state.latency = args.latency
+    app.state.jitter = args.jitter
+    app.state.error_rate = args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,519 @@
 # uvicorn myapp:app --reload
+import asyncio
 import os
 import re
+import time
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from openai import AsyncOpenAI
 from pydantic import BaseModel
 
-aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from cache import LRUCache, RefactorCache, SQLiteCache, make_cache_key
+from chunking import join_chunks, split_python_source
+from gateway import UpstreamGateway, UpstreamUnavailable, make_http_client
+from metrics import TOKEN_BUCKETS, Registry
+from singleflight import SingleFlight
+from streaming import CodeFenceParser, sse_event
+
+if os.getenv("REFACTOR_FAKE_OPENAI"):
+    from fake_openai import FakeAsyncOpenAI
+
+    aclient = FakeAsyncOpenAI(latency=float(os.getenv("REFACTOR_FAKE_LATENCY", "0.2")))
+else:
+    # Retries are handled by the gateway below, not by the client
+    aclient = AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=make_http_client(
+            max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+            max_keepalive=int(os.getenv("OPENAI_MAX_KEEPALIVE", "20")),
+        ),
+        max_retries=0,
+    )
+
+# Shared rate limiting, retries and circuit breaking for every upstream call
+gateway = UpstreamGateway(
+    requests_per_minute=int(os.getenv("OPENAI_RPM_LIMIT", "500")),
+    tokens_per_minute=int(os.getenv("OPENAI_TPM_LIMIT", "30000")),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "4")),
+    max_queue_wait=float(os.getenv("OPENAI_MAX_QUEUE_WAIT", "30")),
+)
+
+MODEL = "gpt-4o"
+TEMPERATURE = 0.2
+MAX_TOKENS = 800
+PROMPT_TEMPLATE = (
+    "Refactor the following {language} code to be more efficient and pythonic. "
+    "Explain the changes you made:\n\n"
+    "Original code:\n{code}\n\nRefactored code with explanation:"
+)
+
+# Set REFACTOR_CACHE_DB to a file path to keep cached refactors across restarts
+response_cache = RefactorCache(
+    memory=LRUCache(
+        max_entries=int(os.getenv("REFACTOR_CACHE_SIZE", "1024")),
+        max_bytes=int(os.getenv("REFACTOR_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+        ttl=float(os.getenv("REFACTOR_CACHE_TTL", "3600")),
+    ),
+    disk=SQLiteCache(os.environ["REFACTOR_CACHE_DB"])
+    if os.getenv("REFACTOR_CACHE_DB")
+    else None,
+)
+
+# Identical requests that arrive while one is already upstream wait for it
+inflight = SingleFlight()
+
+# Upstream calls a single /refactor/batch request may have in flight at once
+BATCH_CONCURRENCY = int(os.getenv("REFACTOR_BATCH_CONCURRENCY", "8"))
+MAX_BATCH_SIZE = int(os.getenv("REFACTOR_MAX_BATCH_SIZE", "100"))
+
+# Sub-requests a single chunked refactor may have in flight at once
+CHUNK_CONCURRENCY = int(os.getenv("REFACTOR_CHUNK_CONCURRENCY", "4"))
+
+# Children are looked up once here so recording on the hot path stays cheap
+metrics = Registry()
+_stage_seconds = metrics.histogram(
+    "refactor_stage_seconds", "Time spent in each stage of a refactor.", ["stage"]
+)
+STAGE_VALIDATE = _stage_seconds.labels("validate")
+STAGE_CACHE_LOOKUP = _stage_seconds.labels("cache_lookup")
+STAGE_PROMPT_BUILD = _stage_seconds.labels("prompt_build")
+STAGE_UPSTREAM = _stage_seconds.labels("upstream")
+STAGE_PARSE = _stage_seconds.labels("parse")
+STAGE_SERIALIZE = _stage_seconds.labels("serialize")
+REQUEST_SECONDS = metrics.histogram(
+    "refactor_request_seconds", "End-to-end handler time.", ["endpoint"]
+)
+REQUEST_REFACTOR = REQUEST_SECONDS.labels("refactor")
+REQUEST_BATCH = REQUEST_SECONDS.labels("batch")
+REQUEST_STREAM = REQUEST_SECONDS.labels("stream")
+UPSTREAM_TTFT = metrics.histogram(
+    "refactor_upstream_time_to_first_token_seconds",
+    "Time from sending a streaming request to its first token.",
+).labels()
+PROMPT_TOKENS = metrics.histogram(
+    "refactor_prompt_tokens", "Prompt tokens per upstream call.", buckets=TOKEN_BUCKETS
+).labels()
+COMPLETION_TOKENS = metrics.histogram(
+    "refactor_completion_tokens",
+    "Completion tokens per upstream call.",
+    buckets=TOKEN_BUCKETS,
+).labels()
+IN_FLIGHT = metrics.gauge(
+    "refactor_requests_in_flight", "Refactor requests being handled."
+).labels()
+metrics.gauge(
+    "refactor_upstream_in_flight", "Distinct upstream calls running."
+).labels().set_function(lambda: len(inflight))
+metrics.gauge(
+    "refactor_upstream_queue_depth", "Requests waiting for rate-limit quota."
+).labels().set_function(lambda: gateway.queued)
+metrics.gauge(
+    "refactor_cache_hit_ratio", "Share of cache lookups that hit."
+).labels().set_function(lambda: response_cache.stats.as_dict()["hit_rate"])
+metrics.counter("refactor_cache_hits", "Cache hits.").labels().set_function(
+    lambda: response_cache.stats.hits
+)
+metrics.counter("refactor_cache_misses", "Cache misses.").labels().set_function(
+    lambda: response_cache.stats.misses
+)
 
 app = FastAPI()
 
 
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
+
 class RefactorRequest(BaseModel):
     code: str
     language: str = "python"  # Optional, defaults to Python
+    chunked: bool = False  # Refactor a Python file one top-level def/class at a time
+
+
+class ChunkReport(BaseModel):
+    name: str
+    start_line: int
+    end_line: int
+    refactored: bool
+    cached: bool
 
 
 class RefactorResponse(BaseModel):
     original_code: str
     refactored_code: str
     explanation: str
+    chunks: Optional[list[ChunkReport]] = None
+
+
+class BatchRefactorRequest(BaseModel):
+    items: list[RefactorRequest]
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    status_code: int
+    result: Optional[RefactorResponse] = None
+    error: Optional[str] = None
+
+
+class BatchRefactorResponse(BaseModel):
+    results: list[BatchItemResult]
 
 
 async def refactor_code_with_gpt(code: str, language: str):
-    prompt = (
-        f"Refactor the following {language} code to be more efficient and pythonic. "
-        "Explain the changes you made:\n\n"
-        f"Original code:\n{code}\n\nRefactored code with explanation:"
-    )
+    refactored_code, explanation, _ = await refactor_code_cached(code, language)
+    return refactored_code, explanation
+
+
+async def refactor_code_cached(code: str, language: str):
+    """Like refactor_code_with_gpt, but also says whether the answer was cached."""
+    started = time.perf_counter()
+    key = make_cache_key(code, language, MODEL, TEMPERATURE, PROMPT_TEMPLATE)
+    cached = await response_cache.aget(key)
+    STAGE_CACHE_LOOKUP.observe(time.perf_counter() - started)
+    if cached is not None:
+        return (*cached, True)
+
+    result = await inflight.do(key, lambda: _call_upstream(key, code, language))
+    return (*result, False)
+
+
+async def refactor_file_in_chunks(code: str, language: str):
+    """
+    Refactor each top-level function and class as its own request, so large
+    files don't get truncated by max_tokens. Chunks go through the response
+    cache, so re-running on an edited file only pays for the chunks that
+    changed. Code between definitions (imports, constants) is kept verbatim.
+    """
+    try:
+        chunks = split_python_source(code)
+    except SyntaxError as exc:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chunked mode needs valid Python source: {exc.msg} (line {exc.lineno})",
+        )
+    if not any(chunk.is_definition for chunk in chunks):
+        refactored_code, explanation = await refactor_code_with_gpt(code, language)
+        return refactored_code, explanation, []
+
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+
+    async def run(chunk):
+        if not chunk.is_definition:
+            return chunk.source, None, False
+        try:
+            async with semaphore:
+                return await refactor_code_cached(chunk.source, language)
+        except Exception as exc:
+            return "", f"{type(exc).__name__}: {exc}", False
+
+    results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+    sources, explanations, reports = [], [], []
+    for chunk, (refactored_code, explanation, cached) in zip(chunks, results):
+        if not chunk.is_definition:
+            sources.append(chunk.source)
+            continue
+        # A chunk that couldn't be refactored is kept as it was
+        sources.append(refactored_code or chunk.source)
+        if refactored_code:
+            explanations.append(f"`{chunk.name}`: {explanation}")
+        else:
+            explanations.append(f"`{chunk.name}`: left unchanged ({explanation})")
+        reports.append(
+            ChunkReport(
+                name=chunk.name,
+                start_line=chunk.start_line,
+                end_line=chunk.end_line,
+                refactored=bool(refactored_code),
+                cached=cached,
+            )
+        )
+
+    if not any(report.refactored for report in reports):
+        return "", "", reports
+    return join_chunks(sources), "\n\n".join(explanations), reports
+
+
+def build_messages(code, language):
+    prompt = PROMPT_TEMPLATE.format(language=language, code=code)
+    return [
+        {"role": "system", "content": "You are an expert software engineer."},
+        {"role": "user", "content": prompt},
+    ]
+
 
-    response = await aclient.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are an expert software engineer."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.2,
-        max_tokens=800,
+def parse_completion(content):
+    # Extract refactored code (the first triple-backtick block) and explanation
+    # (everything after that block, further fences included, as CodeFenceParser
+    # streams it)
+    block = re.search(r"```(?:\w+\n)?(.*?)```", content, re.DOTALL)
+    if block is None:
+        return "", content
+    return block.group(1).strip(), content[block.end() :].strip()
+
+
+def _record_usage(usage):
+    if usage is not None:
+        PROMPT_TOKENS.observe(usage.prompt_tokens)
+        COMPLETION_TOKENS.observe(usage.completion_tokens)
+
+
+async def _call_upstream(key, code, language):
+    started = time.perf_counter()
+    messages = build_messages(code, language)
+    sent = time.perf_counter()
+    STAGE_PROMPT_BUILD.observe(sent - started)
+    response = await gateway.chat_completion(
+        aclient,
+        model=MODEL,
+        messages=messages,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
     )
+    received = time.perf_counter()
+    latency = received - sent
+    STAGE_UPSTREAM.observe(latency)
+    _record_usage(getattr(response, "usage", None))
 
-    content = response.choices[0].message.content
+    refactored_code, explanation = parse_completion(response.choices[0].message.content)
+    STAGE_PARSE.observe(time.perf_counter() - received)
 
-    # Extract refactored code (inside triple backticks) and explanation (text after)
-    code_blocks = re.findall(r"```(?:\w+\n)?(.*?)```", content, re.DOTALL)
-    refactored_code = code_blocks[0].strip() if code_blocks else ""
-    explanation = content.split("```")[-1].strip() if "```" in content else content
+    # Only cache usable answers so a bad completion gets retried next time
+    if refactored_code:
+        await response_cache.aset(key, (refactored_code, explanation), latency)
 
     return refactored_code, explanation
 
 
-@app.post("/refactor", response_model=RefactorResponse)
-async def refactor_endpoint(req: RefactorRequest):
+async def stream_refactor_events(req: RefactorRequest):
+    started = time.perf_counter()
+    key = make_cache_key(req.code, req.language, MODEL, TEMPERATURE, PROMPT_TEMPLATE)
+    cached = await response_cache.aget(key)
+    STAGE_CACHE_LOOKUP.observe(time.perf_counter() - started)
+    if cached is not None:
+        refactored_code, explanation = cached
+        yield sse_event("code_start", {"language": req.language})
+        yield sse_event("code", refactored_code)
+        yield sse_event("code_end", {})
+        yield sse_event("explanation", explanation)
+        yield sse_event(
+            "done",
+            {
+                **RefactorResponse(
+                    original_code=req.code,
+                    refactored_code=refactored_code,
+                    explanation=explanation,
+                ).model_dump(exclude_none=True),
+                "cached": True,
+            },
+        )
+        return
+
+    parser = CodeFenceParser()
+    content = []
+    started = time.perf_counter()
+    first_token = None
+    try:
+        stream = await gateway.chat_completion(
+            aclient,
+            model=MODEL,
+            messages=build_messages(req.code, req.language),
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            # With include_usage the last chunk carries usage and no choices
+            _record_usage(getattr(chunk, "usage", None))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter()
+                UPSTREAM_TTFT.observe(first_token - started)
+            content.append(delta)
+            for event, data in parser.feed(delta):
+                yield sse_event(event, data)
+    except Exception as exc:
+        # Headers are already sent, so errors have to travel as an event
+        yield sse_event("error", {"detail": f"{type(exc).__name__}: {exc}"})
+        return
+    latency = time.perf_counter() - started
+    STAGE_UPSTREAM.observe(latency)
+
+    for event, data in parser.flush():
+        yield sse_event(event, data)
+
+    refactored_code, explanation = parse_completion("".join(content))
+    if not refactored_code:
+        yield sse_event("error", {"detail": "Failed to refactor code."})
+        return
+
+    await response_cache.aset(key, (refactored_code, explanation), latency)
+    yield sse_event(
+        "done",
+        {
+            **RefactorResponse(
+                original_code=req.code,
+                refactored_code=refactored_code,
+                explanation=explanation,
+            ).model_dump(exclude_none=True),
+            "cached": False,
+        },
+    )
+
+
+async def refactor_one(req: RefactorRequest):
+    started = time.perf_counter()
     if not req.code.strip():
         raise HTTPException(status_code=400, detail="Code cannot be empty.")
+    STAGE_VALIDATE.observe(time.perf_counter() - started)
 
-    refactored_code, explanation = await refactor_code_with_gpt(req.code, req.language)
+    chunks = None
+    if req.chunked:
+        if req.language.strip().lower() != "python":
+            raise HTTPException(
+                status_code=400, detail="Chunked mode only supports Python."
+            )
+        refactored_code, explanation, chunks = await refactor_file_in_chunks(
+            req.code, req.language
+        )
+    else:
+        refactored_code, explanation = await refactor_code_with_gpt(
+            req.code, req.language
+        )
 
     if not refactored_code:
         raise HTTPException(status_code=500, detail="Failed to refactor code.")
 
-    return RefactorResponse(
-        original_code=req.code, refactored_code=refactored_code, explanation=explanation
+    started = time.perf_counter()
+    response = RefactorResponse(
+        original_code=req.code,
+        refactored_code=refactored_code,
+        explanation=explanation,
+        chunks=chunks,
+    )
+    STAGE_SERIALIZE.observe(time.perf_counter() - started)
+    return response
+
+
+@app.post(
+    "/refactor", response_model=RefactorResponse, response_model_exclude_none=True
+)
+async def refactor_endpoint(req: RefactorRequest):
+    started = time.perf_counter()
+    IN_FLIGHT.inc()
+    try:
+        return await refactor_one(req)
+    finally:
+        IN_FLIGHT.dec()
+        REQUEST_REFACTOR.observe(time.perf_counter() - started)
+
+
+async def _track_stream(events):
+    # The body is produced after the handler returns, so time it here
+    started = time.perf_counter()
+    IN_FLIGHT.inc()
+    try:
+        async for event in events:
+            yield event
+    finally:
+        IN_FLIGHT.dec()
+        REQUEST_STREAM.observe(time.perf_counter() - started)
+
+
+@app.post("/refactor/stream")
+async def refactor_stream_endpoint(req: RefactorRequest):
+    if not req.code.strip():
+        raise HTTPException(status_code=400, detail="Code cannot be empty.")
+    if req.chunked:
+        raise HTTPException(
+            status_code=400, detail="Chunked mode is not available for streaming."
+        )
+
+    return StreamingResponse(
+        _track_stream(stream_refactor_events(req)),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream and holding back the first bytes
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Leave out "chunks": null and the unset one of result/error
+@app.post(
+    "/refactor/batch",
+    response_model=BatchRefactorResponse,
+    response_model_exclude_none=True,
+)
+async def refactor_batch_endpoint(batch: BatchRefactorRequest):
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Batch cannot be empty.")
+    if len(batch.items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch is limited to {MAX_BATCH_SIZE} items.",
+        )
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(index, req):
+        # One bad item must not fail the whole batch, so errors are reported per item
+        try:
+            async with semaphore:
+                result = await refactor_one(req)
+        except HTTPException as exc:
+            return BatchItemResult(
+                index=index, status_code=exc.status_code, error=exc.detail
+            )
+        except UpstreamUnavailable as exc:
+            return BatchItemResult(index=index, status_code=503, error=exc.detail)
+        except Exception as exc:
+            return BatchItemResult(
+                index=index, status_code=500, error=f"{type(exc).__name__}: {exc}"
+            )
+        return BatchItemResult(index=index, status_code=200, result=result)
+
+    started = time.perf_counter()
+    IN_FLIGHT.inc()
+    try:
+        # gather keeps results in input order regardless of completion order
+        results = await asyncio.gather(
+            *(run(index, req) for index, req in enumerate(batch.items))
+        )
+    finally:
+        IN_FLIGHT.dec()
+        REQUEST_BATCH.observe(time.perf_counter() - started)
+    return BatchRefactorResponse(results=results)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "entries": len(response_cache.memory),
+        **response_cache.stats.as_dict(),
+        "upstream_calls": inflight.calls,
+        "coalesced": inflight.coalesced,
+    }
+
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    return gateway.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
     )
@@ -0,0 +1,102 @@
+"""
+Helpers for the /refactor/stream endpoint.
+CodeFenceParser watches the completion as it streams in and reports when the
+first ``` code block opens and closes, so clients can render the refactored
+code before the model has finished writing the explanation.
+"""
+
+import json
+import re
+
+FENCE = "```"
+_WORD = re.compile(r"\w*")
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _split_partial_fence(text):
+    """Hold back trailing backticks that could be the start of a fence."""
+    keep = len(text) - len(text.rstrip("`"))
+    keep = min(keep, len(FENCE) - 1)
+    return (text[:-keep], text[-keep:]) if keep else (text, "")
+
+
+class CodeFenceParser:
+    """
+    Incremental version of the regex in refactor_code_with_gpt: the first
+    fenced block (with an optional language tag) is the code, and what
+    follows it is the explanation.
+
+    feed() returns a list of (event, data) tuples:
+        ("text", str)          text before the code block
+        ("code_start", dict)   the opening fence, with its language tag
+        ("code", str)          code inside the first block
+        ("code_end", {})       the closing fence
+        ("explanation", str)   text after the first block
+    """
+
+    def __init__(self):
+        self.state = "text"  # text -> lang -> code -> explanation
+        self._pending = ""
+        self._explained = False
+
+    def feed(self, delta):
+        self._pending += delta
+        events = []
+        while True:
+            if self.state == "lang":
+                # The tag is "\w+\n"; until we see a non-word char we can't tell
+                match = _WORD.match(self._pending)
+                if match.end() == len(self._pending):
+                    break
+                language = ""
+                if match.end() and self._pending[match.end()] == "\n":
+                    language = match.group()
+                    self._pending = self._pending[match.end() + 1 :]
+                events.append(("code_start", {"language": language}))
+                self.state = "code"
+                continue
+
+            if self.state == "explanation":
+                # Stripped like parse_completion: no leading whitespace, and
+                # trailing whitespace waits until more text follows it
+                if not self._explained:
+                    self._pending = self._pending.lstrip()
+                text = self._pending.rstrip()
+                if text:
+                    events.append(("explanation", text))
+                    self._explained = True
+                self._pending = self._pending[len(text) :]
+                break
+
+            kind = "text" if self.state == "text" else "code"
+            index = self._pending.find(FENCE)
+            if index == -1:
+                ready, self._pending = _split_partial_fence(self._pending)
+                if ready:
+                    events.append((kind, ready))
+                break
+            if index:
+                events.append((kind, self._pending[:index]))
+            self._pending = self._pending[index + len(FENCE) :]
+            if self.state == "text":
+                self.state = "lang"
+            else:
+                events.append(("code_end", {}))
+                self.state = "explanation"
+        return events
+
+    def flush(self):
+        """Emit whatever is still buffered once the stream has ended."""
+        events = []
+        if self.state == "lang":
+            events.append(("code_start", {"language": ""}))
+            self.state = "code"
+        # Whatever the explanation still holds is trailing whitespace
+        if self._pending and self.state != "explanation":
+            kind = "code" if self.state == "code" else self.state
+            events.append((kind, self._pending))
+            self._pending = ""
+        return events
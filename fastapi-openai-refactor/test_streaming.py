@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from myapp import parse_completion  # noqa: E402
+from streaming import CodeFenceParser  # noqa: E402
+
+
+def stream(content, size):
+    """Feed `content` to a CodeFenceParser in `size`-character deltas."""
+    parser = CodeFenceParser()
+    events = []
+    for start in range(0, len(content), size):
+        events += parser.feed(content[start : start + size])
+    events += parser.flush()
+    code = "".join(data for event, data in events if event == "code").strip()
+    explanation = "".join(data for event, data in events if event == "explanation")
+    return code, explanation
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "a```b```c```d",
+        "Here:\n```python\nx = 1\n```\nUse `x` like this:\n```python\nprint(x)\n```\nDone.\n",
+        "```python\ndef f():\n    return 1\n```\n\n  Renamed the function.  \n",
+        "```\nno tag\n```",
+    ],
+)
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_streamed_parse_matches_parse_completion(content, size):
+    assert stream(content, size) == parse_completion(content)
+
+
+def test_explanation_keeps_later_fences():
+    assert parse_completion("a```b```c```d") == ("b", "c```d")
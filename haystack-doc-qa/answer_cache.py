@@ -0,0 +1,208 @@
+"""
+Answer cache for the PDF Q&A pipeline.
+Retrieval is cheap and runs on every query; the cache sits between it and
+the prompt/LLM steps. An entry is keyed on the normalized query plus the set
+of retrieved document ids, so the same question over changed evidence is a
+miss. Only exact matches are served: the bundled LocalEmbedder is lexical and
+scores opposite questions ("best" vs "worst practice") as closer than real
+paraphrases, so near-duplicate matching on it would serve wrong answers.
+
+Each entry remembers the sha256 of the PDFs its documents came from, as
+recorded in the ingest manifest, and is dropped once any of them changes.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from haystack import Document
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize_query(query):
+    """Case, punctuation and spacing don't change the question."""
+    return " ".join(_WORD.findall(unicodedata.normalize("NFKC", query).lower()))
+
+
+def _doc_set_key(documents):
+    ids = sorted({doc.id for doc in documents})
+    return hashlib.sha256(json.dumps(ids).encode("utf-8")).hexdigest()
+
+
+def make_cache_key(query, documents):
+    payload = json.dumps([normalize_query(query), _doc_set_key(documents)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    In-memory LRU of answers, optionally written through to SQLite so it
+    survives restarts. `file_versions` (file name -> sha256, see
+    ingest.file_versions) is the current state of the corpus; entries built
+    from other versions are dropped on load and by invalidate(). Without
+    `file_versions` nothing is checked or dropped.
+    """
+
+    def __init__(self, path=None, file_versions=None, max_entries=10_000):
+        self.file_versions = file_versions or {}
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # key -> {"query", "answer", "documents", "files"}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answer_cache ("
+                " key TEXT PRIMARY KEY,"
+                " entry TEXT NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            self._conn.commit()
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self):
+        rows = self._conn.execute("SELECT key, entry FROM answer_cache ORDER BY created").fetchall()
+        entries = [(key, json.loads(entry)) for key, entry in rows]
+        stale = [key for key, entry in entries if not self._is_current(entry)]
+        entries = [(key, entry) for key, entry in entries if self._is_current(entry)]
+        for key, entry in entries[-self.max_entries :]:
+            self._entries[key] = entry
+        stale += [key for key, _ in entries[: -self.max_entries]]
+        if stale:
+            self._conn.executemany("DELETE FROM answer_cache WHERE key = ?", [(key,) for key in stale])
+            self._conn.commit()
+
+    def _is_current(self, entry):
+        # No manifest to compare against, e.g. a cache opened just to read it
+        if not self.file_versions:
+            return True
+        return all(self.file_versions.get(name) == sha for name, sha in entry["files"].items())
+
+    def lookup(self, query, documents):
+        """
+        The cached {"answer", "documents", "match"} for `query` given the
+        retrieved `documents`, or None. "match" is always "exact".
+        """
+        key = make_cache_key(query, documents)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return {
+            "answer": entry["answer"],
+            "documents": [Document.from_dict(data) for data in entry["documents"]],
+            "match": "exact",
+        }
+
+    def store(self, query, documents, answer, sources):
+        """
+        Cache `answer` for `query` over the retrieved `documents`. `sources`
+        are the documents shown with the answer (e.g. after context packing).
+        """
+        key = make_cache_key(query, documents)
+        files = {}
+        for doc in documents:
+            name = doc.meta.get("file_path")
+            if name is not None:
+                files[name] = self.file_versions.get(name)
+        entry = {
+            "query": query,
+            "answer": answer,
+            "documents": [doc.to_dict(flatten=False) for doc in sources],
+            "files": files,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answer_cache VALUES (?, ?, ?)",
+                    (key, json.dumps(entry), time.time()),
+                )
+                self._conn.executemany(
+                    "DELETE FROM answer_cache WHERE key = ?", [(old,) for old in evicted]
+                )
+                self._conn.commit()
+
+    def invalidate(self, file_versions):
+        """Switch to new file versions and drop entries built from older ones."""
+        with self._lock:
+            self.file_versions = file_versions
+            stale = [key for key, entry in self._entries.items() if not self._is_current(entry)]
+            for key in stale:
+                del self._entries[key]
+            if self._conn is not None and stale:
+                self._conn.executemany(
+                    "DELETE FROM answer_cache WHERE key = ?", [(key,) for key in stale]
+                )
+                self._conn.commit()
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM answer_cache")
+                self._conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedPipeline:
+    """
+    Runs a pipeline built by haystack_pdf_qa.build_pipeline with an
+    AnswerCache between retrieval and generation. run() returns the same
+    {"packer": {"documents"}, "llm": {"replies"}} shape as pipe.run with
+    include_outputs_from={"packer", "llm"}, plus "cache": "exact" or "miss".
+    """
+
+    def __init__(self, pipeline, cache):
+        pipeline.warm_up()
+        self.pipeline = pipeline
+        self.cache = cache
+        self.retriever = pipeline.get_component("retriever")
+        self.packer = pipeline.get_component("packer")
+        self.prompt_builder = pipeline.get_component("prompt_builder")
+        self.llm = pipeline.get_component("llm")
+
+    def run(self, query, top_k=None):
+        documents = self.retriever.run(query=query, top_k=top_k)["documents"]
+        cached = self.cache.lookup(query, documents)
+        if cached is not None:
+            return {
+                "packer": {"documents": cached["documents"]},
+                "llm": {"replies": [cached["answer"]]},
+                "cache": cached["match"],
+            }
+
+        packed = self.packer.run(documents=documents)["documents"]
+        prompt = self.prompt_builder.run(query=query, documents=packed)["prompt"]
+        replies = self.llm.run(prompt=prompt)["replies"]
+        self.cache.store(query, documents, replies[0], packed)
+        return {"packer": {"documents": packed}, "llm": {"replies": replies}, "cache": "miss"}
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+BM25 retrieval benchmark.
+Scales the generated tech_blogs chunks up to a large synthetic corpus and
+compares InMemoryBM25Retriever with the NumPy and memory-mapped retrievers
+from bm25_index.py on query latency, batch throughput and result agreement.
+
+    python generate_example_pdfs.py
+    python bench_bm25.py --chunks 100000 --output bm25.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from haystack import Document
+from haystack.components.retrievers.in_memory import InMemoryBM25Retriever
+from haystack.document_stores.in_memory import InMemoryDocumentStore
+
+from bm25_index import MmapBM25DocumentStore, MmapBM25Retriever, NumpyBM25Retriever
+from ingest import ingest_pdfs
+
+
+def scale_corpus(base_docs, num_chunks, chunk_words=200, seed=0):
+    """
+    `num_chunks` synthetic chunks cut from the base text at random offsets.
+    A share of the words get numeric suffixes so the vocabulary keeps growing
+    with the corpus instead of every chunk reusing the same few hundred terms.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(" ".join(doc.content for doc in base_docs).split())
+    if len(words) < chunk_words:
+        words = np.resize(words, chunk_words)
+    starts = rng.integers(0, len(words) - chunk_words + 1, size=num_chunks)
+    docs = []
+    for i, start in enumerate(starts):
+        chunk = words[start : start + chunk_words].copy()
+        varied = rng.random(chunk_words) < 0.1
+        suffixes = rng.zipf(1.5, size=int(varied.sum()))
+        chunk[varied] = [f"{word}{n}" for word, n in zip(chunk[varied], suffixes)]
+        docs.append(Document(content=" ".join(chunk), meta={"chunk": i}))
+    return docs
+
+
+def make_queries(docs, count, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for i in rng.integers(0, len(docs), size=count):
+        words = docs[i].content.split()
+        start = rng.integers(0, max(1, len(words) - 6))
+        queries.append(" ".join(words[start : start + rng.integers(3, 7)]))
+    return queries
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def latency_stats(seconds):
+    ms = sorted(s * 1000 for s in seconds)
+    return {
+        "queries": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(ms[len(ms) // 2], 3),
+        "p90_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.90))], 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "p99_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.99))], 3),
+    }
+
+
+def per_query(retriever, queries, top_k):
+    results, seconds = [], []
+    for query in queries:
+        result, elapsed = timed(retriever.run, query=query, top_k=top_k)
+        results.append(result["documents"])
+        seconds.append(elapsed)
+    return results, latency_stats(seconds)
+
+
+def exact_share(scorer, queries, top_k):
+    """
+    Share of queries whose top_k match a brute-force ranking with the same
+    scorer: every document scored, fully sorted. Ties at the k-th score may
+    be broken either way, so a result counts as exact when its scores are the
+    reference's best k scores.
+    """
+    exact = 0
+    for (docs, scores), (_, best) in zip(
+        scorer.top_k_batch(queries, top_k), scorer.top_k_batch(queries, None)
+    ):
+        exact += np.allclose(scores, best[:top_k])
+    return round(exact / len(queries), 4) if queries else None
+
+
+def overlap(expected, actual):
+    """
+    Mean share of the baseline's top-k ids that a retriever also returned.
+    InMemoryBM25Retriever's BM25Okapi uses the original Okapi idf (no +1, with
+    an epsilon floor for very common terms), so this is a sanity check rather
+    than an exact-match test.
+    """
+    shares = []
+    for want, got in zip(expected, actual):
+        # The baseline pads with zero-score documents; only real hits count
+        want = {doc.id for doc in want if doc.score and doc.score > 0}
+        if want:
+            shares.append(len(want & {doc.id for doc in got}) / len(want))
+    return round(statistics.fmean(shares), 4) if shares else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BM25 retrievers.")
+    parser.add_argument("--folder", default="./tech_blogs")
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--baseline-queries",
+        type=int,
+        default=20,
+        help="InMemoryBM25Retriever is slow at this size, so it gets fewer",
+    )
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.folder, "*.pdf")))
+    if not paths:
+        parser.error(f"no PDFs in {args.folder}; run generate_example_pdfs.py first")
+    base_docs, _ = ingest_pdfs(paths)
+    docs = scale_corpus(base_docs, args.chunks, seed=args.seed)
+    queries = make_queries(docs, args.queries, seed=args.seed)
+    baseline_queries = queries[: args.baseline_queries]
+    report = {
+        "corpus": {"base_chunks": len(base_docs), "chunks": len(docs)},
+        "top_k": args.top_k,
+    }
+
+    store = InMemoryDocumentStore(bm25_algorithm="BM25Okapi")
+    _, write_seconds = timed(store.write_documents, docs)
+    baseline = InMemoryBM25Retriever(document_store=store)
+    baseline_results, baseline_latency = per_query(baseline, baseline_queries, args.top_k)
+
+    numpy_retriever = NumpyBM25Retriever(document_store=store)
+    _, numpy_index_seconds = timed(numpy_retriever.warm_up)
+    numpy_results, numpy_latency = per_query(numpy_retriever, queries, args.top_k)
+    _, batch_seconds = timed(numpy_retriever.run_batch, queries, top_k=args.top_k)
+
+    index_dir = tempfile.mkdtemp(prefix="bm25-bench-")
+    try:
+        mmap_store = MmapBM25DocumentStore(os.path.join(index_dir, "index"))
+        _, mmap_build_seconds = timed(mmap_store.build, docs)
+        mmap_store, mmap_open_seconds = timed(
+            MmapBM25DocumentStore, os.path.join(index_dir, "index")
+        )
+        mmap_results, mmap_latency = per_query(
+            MmapBM25Retriever(document_store=mmap_store), queries, args.top_k
+        )
+        mmap_store.index.close()
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    report["in_memory_bm25"] = {
+        "write_seconds": round(write_seconds, 3),
+        **baseline_latency,
+    }
+    report["numpy_bm25"] = {
+        "index_seconds": round(numpy_index_seconds, 3),
+        **numpy_latency,
+        "batch_seconds": round(batch_seconds, 4),
+        "batch_queries_per_second": round(len(queries) / batch_seconds, 1),
+        "exact_top_k": exact_share(numpy_retriever._scorer, queries, args.top_k),
+        "overlap_with_baseline": overlap(baseline_results, numpy_results),
+        "speedup_p50": round(baseline_latency["p50_ms"] / numpy_latency["p50_ms"], 1),
+    }
+    report["mmap_bm25"] = {
+        "build_seconds": round(mmap_build_seconds, 3),
+        "open_seconds": round(mmap_open_seconds, 4),
+        **mmap_latency,
+        "overlap_with_baseline": overlap(baseline_results, mmap_results),
+        "speedup_p50": round(baseline_latency["p50_ms"] / mmap_latency["p50_ms"], 1),
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Retrieval quality and latency benchmark for haystack_pdf_qa.
+Ingests a corpus with ground truth (see generate_example_pdfs.py --count) once
+per split setting in the grid, builds the BM25 and dense indexes, and runs
+the labeled questions through the Q&A pipeline with a stub generator, so it
+runs offline and measures everything except the LLM call:
+
+* ingestion throughput (PDFs and chunks per second) and index build time
+* retrieval latency percentiles per query
+* recall@k and MRR: a question is answered by a chunk of its ground-truth file,
+  overall and per question kind (lexical, paraphrase, mismatch)
+* prompt tokens per query, and how often the packed prompt holds the fact
+
+Every quality metric of a retriever that falls below the pipeline's default
+retriever (RETRIEVER, BM25 unless set) is listed under "regressions", and
+--fail-on-regression turns those into a non-zero exit status.
+
+    python generate_example_pdfs.py --count 1000 --out ./synthetic_blogs
+    python bench_retrieval.py --folder ./synthetic_blogs --split-lengths 100,200 \\
+        --split-overlaps 0,20 --output retrieval.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+from typing import List
+
+from haystack import component
+
+from bench_bm25 import latency_stats, timed
+from bm25_index import MmapBM25DocumentStore, MmapBM25Retriever
+from context_packing import estimate_tokens
+from haystack_pdf_qa import RETRIEVER, build_pipeline
+from hybrid_retrieval import DenseIndex
+from ingest import DEFAULT_SPLIT, ingest_pdfs
+
+
+@component
+class StubGenerator:
+    """Stands in for OpenAIGenerator: a fixed reply, and usage from the prompt size."""
+
+    @component.output_types(replies=List[str], meta=List[dict])
+    def run(self, prompt: str):
+        usage = {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": 0}
+        return {"replies": ["(stub answer)"], "meta": [{"model": "stub", "usage": usage}]}
+
+
+def load_ground_truth(path, max_queries=None, seed=0):
+    with open(path) as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+    if max_queries and len(queries) > max_queries:
+        queries = random.Random(seed).sample(queries, max_queries)
+    return queries
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",") if value]
+
+
+def _flat(text):
+    # pypdf breaks lines where the PDF wrapped them
+    return " ".join(text.split())
+
+
+def quality(ranks, ks, depth):
+    """recall@k for each k and MRR over the first `depth` results."""
+    report = {}
+    for k in ks:
+        report[f"recall@{k}"] = round(sum(r is not None and r <= k for r in ranks) / len(ranks), 4)
+    report[f"mrr@{depth}"] = round(statistics.fmean(1 / r if r else 0.0 for r in ranks), 4)
+    return report
+
+
+def evaluate(retriever, pipeline, queries, ks, top_k):
+    """
+    Run `queries` through `retriever`, then the packer, prompt builder and
+    stub generator of `pipeline`. Ranks come from one retrieval of depth
+    max(ks); the prompt gets the first `top_k` of it, as the retriever would
+    return with that top_k.
+    """
+    packer = pipeline.get_component("packer")
+    prompt_builder = pipeline.get_component("prompt_builder")
+    llm = pipeline.get_component("llm")
+    depth = max(ks + [top_k])
+
+    retrieval_seconds, pipeline_seconds, prompt_tokens = [], [], []
+    ranks = []
+    evidence_found = 0
+    for query in queries:
+        result, retrieval = timed(retriever.run, query=query["question"], top_k=depth)
+        documents = result["documents"]
+        (prompt, reply), rest = timed(_answer, packer, prompt_builder, llm, query, documents[:top_k])
+        retrieval_seconds.append(retrieval)
+        pipeline_seconds.append(retrieval + rest)
+        prompt_tokens.append(reply["meta"][0]["usage"]["prompt_tokens"])
+        files = set(query.get("files") or [query["file"]])
+        ranks.append(
+            next(
+                (rank for rank, doc in enumerate(documents, 1) if doc.meta.get("file_path") in files),
+                None,
+            )
+        )
+        if "evidence" in query:
+            evidence_found += _flat(query["evidence"]) in _flat(prompt)
+
+    report = {"latency": latency_stats(retrieval_seconds), **quality(ranks, ks, depth)}
+    kinds = {}
+    for query, rank in zip(queries, ranks):
+        kinds.setdefault(query.get("kind", "lexical"), []).append(rank)
+    if len(kinds) > 1:
+        report["by_kind"] = {
+            kind: {"queries": len(kind_ranks), **quality(kind_ranks, ks, depth)}
+            for kind, kind_ranks in sorted(kinds.items())
+        }
+    if any("evidence" in query for query in queries):
+        report["evidence_in_prompt"] = round(evidence_found / len(queries), 4)
+    report["prompt_tokens"] = {
+        "mean": round(statistics.fmean(prompt_tokens), 1),
+        "p50": sorted(prompt_tokens)[len(prompt_tokens) // 2],
+        "max": max(prompt_tokens),
+    }
+    report["pipeline_latency"] = latency_stats(pipeline_seconds)
+    return report
+
+
+def _answer(packer, prompt_builder, llm, query, documents):
+    packed = packer.run(documents=documents)["documents"]
+    prompt = prompt_builder.run(query=query["question"], documents=packed)["prompt"]
+    return prompt, llm.run(prompt=prompt)
+
+
+def find_regressions(run, baseline, tolerance):
+    """
+    Quality metrics (recall@k, MRR, evidence in prompt) on which another
+    retriever in `run` scores more than `tolerance` below `baseline`.
+    Per-kind metrics are named "<kind>/<metric>".
+    """
+    if baseline not in run:
+        return []
+    regressions = []
+    for retriever, report in run.items():
+        if retriever == baseline or not isinstance(report, dict) or "latency" not in report:
+            continue
+        expected_metrics = _quality_metrics(run[baseline])
+        for metric, value in _quality_metrics(report).items():
+            expected = expected_metrics.get(metric)
+            if expected is None:
+                continue
+            if value < expected - tolerance:
+                regressions.append(
+                    {
+                        "retriever": retriever,
+                        "metric": metric,
+                        "value": value,
+                        baseline: expected,
+                    }
+                )
+    return regressions
+
+
+def _quality_metrics(report):
+    metrics = {
+        metric: value
+        for metric, value in report.items()
+        if metric.startswith(("recall@", "mrr@", "evidence_in_prompt"))
+    }
+    for kind, kind_report in report.get("by_kind", {}).items():
+        metrics.update(
+            (f"{kind}/{metric}", value)
+            for metric, value in kind_report.items()
+            if metric.startswith(("recall@", "mrr@"))
+        )
+    return metrics
+
+
+def run_setting(paths, queries, split, retrievers, ks, top_k, workers, work_dir):
+    """Ingest, index and evaluate one split setting. Everything is built fresh."""
+    name = f"{split['split_length']}-{split['split_overlap']}"
+    cache_dir = os.path.join(work_dir, f"cache-{name}")
+    documents, stats = ingest_pdfs(paths, cache_dir=cache_dir, workers=workers, split=split)
+    if stats["failed"]:
+        print(f"warning: {stats['failed']} PDFs failed to parse: {stats['errors']}")
+
+    document_store = MmapBM25DocumentStore(os.path.join(work_dir, f"bm25-{name}"))
+    _, bm25_seconds = timed(document_store.build, documents, fingerprint=stats["fingerprint"])
+    dense_index_dir = os.path.join(work_dir, f"dense-{name}")
+    _, dense_seconds = timed(
+        DenseIndex.build, documents, dense_index_dir, fingerprint=stats["fingerprint"]
+    )
+
+    pipeline = build_pipeline(document_store, dense_index_dir, generator=StubGenerator(), hybrid=True)
+    pipeline.warm_up()
+    candidates = {
+        "hybrid": pipeline.get_component("retriever"),
+        "bm25": MmapBM25Retriever(document_store=document_store),
+    }
+    # A cached or tiny corpus can ingest in under the timer's resolution
+    seconds = max(stats["seconds"], 1e-9)
+    result = {
+        **split,
+        "ingest": {
+            "files": stats["files"],
+            "chunks": stats["chunks"],
+            "seconds": stats["seconds"],
+            "files_per_second": round(stats["files"] / seconds, 1),
+            "chunks_per_second": round(stats["chunks"] / seconds, 1),
+        },
+        "index_seconds": {"bm25": round(bm25_seconds, 3), "dense": round(dense_seconds, 3)},
+    }
+    for retriever in retrievers:
+        result[retriever] = evaluate(candidates[retriever], pipeline, queries, ks, top_k)
+    document_store.index.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency.")
+    parser.add_argument("--folder", default="./synthetic_blogs")
+    parser.add_argument("--ground-truth", help="default: <folder>/ground_truth.jsonl")
+    parser.add_argument("--max-queries", type=int, default=500)
+    parser.add_argument(
+        "--split-lengths", type=_int_list, default=[DEFAULT_SPLIT["split_length"]]
+    )
+    parser.add_argument(
+        "--split-overlaps", type=_int_list, default=[DEFAULT_SPLIT["split_overlap"]]
+    )
+    parser.add_argument("--ks", type=_int_list, default=[1, 3, 5, 10], help="recall@k cutoffs")
+    parser.add_argument("--top-k", type=int, default=5, help="documents retrieved for the prompt")
+    parser.add_argument("--retrievers", default="hybrid,bm25")
+    parser.add_argument("--workers", type=int, default=None, help="ingest workers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--tolerance", type=float, default=0.01, help="allowed drop below the default retriever"
+    )
+    parser.add_argument(
+        "--fail-on-regression", action="store_true", help="exit with status 1 on any regression"
+    )
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.folder, "*.pdf")))
+    ground_truth = args.ground_truth or os.path.join(args.folder, "ground_truth.jsonl")
+    if not paths or not os.path.exists(ground_truth):
+        parser.error(
+            f"no PDFs or ground truth in {args.folder}; "
+            "run generate_example_pdfs.py --count N --out <folder> first"
+        )
+    retrievers = [name for name in args.retrievers.split(",") if name]
+    unknown = set(retrievers) - {"hybrid", "bm25"}
+    if unknown:
+        parser.error(f"unknown retrievers: {', '.join(sorted(unknown))}")
+    queries = load_ground_truth(ground_truth, args.max_queries, args.seed)
+
+    report = {
+        "corpus": {"folder": args.folder, "files": len(paths), "queries": len(queries)},
+        "ks": args.ks,
+        "top_k": args.top_k,
+        "default_retriever": RETRIEVER,
+        "runs": [],
+        "regressions": [],
+    }
+    work_dir = tempfile.mkdtemp(prefix="retrieval-bench-")
+    try:
+        for split_length in args.split_lengths:
+            for split_overlap in args.split_overlaps:
+                if split_overlap >= split_length:
+                    continue
+                split = {"split_length": split_length, "split_overlap": split_overlap}
+                run = run_setting(
+                    paths, queries, split, retrievers, args.ks, args.top_k, args.workers, work_dir
+                )
+                run["regressions"] = find_regressions(run, RETRIEVER, args.tolerance)
+                report["runs"].append(run)
+                report["regressions"] += [{**split, **item} for item in run["regressions"]]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    for item in report["regressions"]:
+        print(
+            f"REGRESSION {item['split_length']}-{item['split_overlap']}: {item['retriever']} "
+            f"{item['metric']} {item['value']} < {RETRIEVER} {item[RETRIEVER]}",
+            file=sys.stderr,
+        )
+    if args.fail_on_regression and report["regressions"]:
+        sys.exit(1)
+
+
+# Ingestion starts worker processes that re-import this module
+if __name__ == "__main__":
+    main()
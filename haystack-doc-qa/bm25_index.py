@@ -0,0 +1,609 @@
+"""
+Disk-backed BM25 index, memory-mapped at startup.
+The index is built once and written as a directory of flat files:
+
+    meta.json           corpus statistics and BM25 parameters
+    terms.bin           every term in UTF-8, sorted by bytes; a term's id is its rank
+    term_offsets.npy    int64, term t is terms.bin[term_offsets[t]:term_offsets[t + 1]]
+    offsets.npy         int64, postings of term t are [offsets[t], offsets[t + 1])
+    postings_docs.npy   int32 document numbers, grouped by term
+    postings_tf.npy     int32 term frequencies, parallel to postings_docs
+    doc_lengths.npy     int32 tokens per document
+    docs.jsonl          one serialized Document per line
+    doc_offsets.npy     int64 byte offset of each line in docs.jsonl
+
+Everything is opened with mmap, the vocabulary included (terms are looked up
+by binary search in place), so a new process starts without parsing or
+rebuilding anything, and worker processes serving the same index share its
+pages through the OS page cache.
+
+Scoring is done by BM25Scorer, which also backs NumpyBM25Retriever for
+documents that live in any other document store.
+"""
+
+import json
+import mmap
+import os
+import re
+import shutil
+from collections import Counter
+from dataclasses import replace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from haystack import Document, component, default_from_dict, default_to_dict
+from haystack.core.serialization import import_class_by_name
+from haystack.document_stores.errors import DuplicateDocumentError
+from haystack.document_stores.types import DuplicatePolicy
+from haystack.utils.filters import document_matches_filter
+
+# Same tokenization as InMemoryDocumentStore
+TOKEN_PATTERN = r"(?u)\b\w+\b"
+_TOKEN_RE = re.compile(TOKEN_PATTERN)
+INDEX_VERSION = 2
+# Memory for the (queries x docs) float32 score matrix a batch of queries is
+# summed into; at least MIN_SCORE_BLOCK queries share one, however large the
+# corpus, so their common terms are still scored once per block
+SCORE_MATRIX_BYTES = 32 << 20
+MIN_SCORE_BLOCK = 4
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def load_array(path):
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # Zero-length arrays can't be mapped
+        return np.load(path)
+
+
+def replace_dir(tmp_dir, index_dir):
+    """Move a freshly written `tmp_dir` into place as `index_dir`."""
+    # Swap directories; processes still mapping the old files keep reading them
+    old_dir = f"{index_dir}.old-{os.getpid()}"
+    if os.path.exists(index_dir):
+        os.rename(index_dir, old_dir)
+    os.rename(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def build_postings(documents):
+    """
+    Postings for `documents` as NumPy arrays:
+    (vocab, offsets, postings_docs, postings_tf, doc_lengths).
+    """
+    vocab = {}
+    term_ids, doc_ids, tfs = [], [], []
+    doc_lengths = np.zeros(len(documents), dtype=np.int32)
+    for i, doc in enumerate(documents):
+        tokens = tokenize(doc.content)
+        doc_lengths[i] = len(tokens)
+        for term, count in Counter(tokens).items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            doc_ids.append(i)
+            tfs.append(count)
+
+    # Renumber terms in sorted byte order, so the vocabulary can be stored as
+    # a sorted array and searched where it lies (see TermIndex)
+    terms = sorted(vocab, key=lambda term: term.encode("utf-8"))
+    rank = np.empty(len(terms), dtype=np.int64)
+    rank[np.array([vocab[term] for term in terms], dtype=np.int64)] = np.arange(len(terms))
+    vocab = {term: i for i, term in enumerate(terms)}
+
+    # Group postings by term; the stable sort keeps documents ascending
+    term_ids = rank[np.array(term_ids, dtype=np.int64)]
+    order = np.argsort(term_ids, kind="stable")
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=offsets[1:])
+    postings_docs = np.array(doc_ids, dtype=np.int32)[order]
+    postings_tf = np.array(tfs, dtype=np.int32)[order]
+    return vocab, offsets, postings_docs, postings_tf, doc_lengths
+
+
+class TermIndex:
+    """
+    Read-only term -> term id map over a sorted, memory-mapped term array,
+    as written by write(). get() is a binary search, so nothing is loaded
+    into the process up front.
+    """
+
+    def __init__(self, terms_path, offsets_path):
+        self.offsets = load_array(offsets_path)
+        self._file = open(terms_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._terms = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _term(self, i):
+        return self._terms[int(self.offsets[i]) : int(self.offsets[i + 1])]
+
+    def get(self, term, default=None):
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self._term(lo) == key else default
+
+    @staticmethod
+    def write(vocab, terms_path, offsets_path):
+        """Write a vocab from build_postings(), whose ids are the sorted ranks."""
+        terms = [term.encode("utf-8") for term in sorted(vocab, key=vocab.get)]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in terms], out=offsets[1:])
+        with open(terms_path, "wb") as f:
+            f.write(b"".join(terms))
+        np.save(offsets_path, offsets)
+
+    def close(self):
+        if isinstance(self._terms, mmap.mmap):
+            self._terms.close()
+        self._file.close()
+
+
+class BM25Scorer:
+    """
+    Okapi BM25 over postings held in NumPy arrays, in memory or memory-mapped.
+    Only the postings of the query terms are read: their contributions are
+    computed in one vectorized pass, summed per document, and the best k are
+    picked with argpartition instead of sorting every score.
+    """
+
+    def __init__(self, vocab, offsets, postings_docs, postings_tf, doc_lengths, k1=1.5, b=0.75):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(doc_lengths)
+        self.avg_doc_length = float(np.mean(doc_lengths)) if self.num_docs else 0.0
+        # Per-document length normalization, computed once rather than per posting
+        self.norms = (
+            k1 * (1 - b + b * np.asarray(doc_lengths, dtype=np.float32) / self.avg_doc_length)
+            if self.num_docs
+            else np.empty(0, dtype=np.float32)
+        )
+
+    def idf(self, doc_freq):
+        return np.log((self.num_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1.0)
+
+    def _query_postings(self, queries):
+        """(query number, doc, contribution) for every posting of every query term."""
+        query_numbers, starts, ends = [], [], []
+        for number, query in enumerate(queries):
+            # Repeated query words count once, as in InMemoryDocumentStore
+            for term in dict.fromkeys(tokenize(query)):
+                term_id = self.vocab.get(term)
+                if term_id is not None:
+                    query_numbers.append(number)
+                    starts.append(int(self.offsets[term_id]))
+                    ends.append(int(self.offsets[term_id + 1]))
+        if not starts:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+
+        lengths = np.array(ends) - np.array(starts)
+        docs = np.concatenate([self.postings_docs[a:b] for a, b in zip(starts, ends)])
+        tf = np.concatenate([self.postings_tf[a:b] for a, b in zip(starts, ends)]).astype(np.float32)
+        weights = np.repeat(self.idf(lengths).astype(np.float32) * (self.k1 + 1), lengths)
+        contributions = weights * tf / (tf + self.norms[docs])
+        return np.repeat(np.array(query_numbers), lengths), docs.astype(np.int64), contributions
+
+    def _term_rows(self, queries):
+        """Term id -> rows of `queries` containing that term, in first-seen order."""
+        rows = {}
+        for row, query in enumerate(queries):
+            for term in dict.fromkeys(tokenize(query)):
+                term_id = self.vocab.get(term)
+                if term_id is not None:
+                    rows.setdefault(term_id, []).append(row)
+        return rows
+
+    def _term_contributions(self, term_id):
+        """(docs, contribution) for every posting of one term."""
+        start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+        docs = self.postings_docs[start:end]
+        tf = self.postings_tf[start:end].astype(np.float32)
+        weight = np.float32(self.idf(end - start) * (self.k1 + 1))
+        return docs, weight * tf / (tf + self.norms[docs])
+
+    def score_batch(self, queries):
+        """For each query, (doc numbers, scores) of the documents matching any of its terms."""
+        query_numbers, docs, contributions = self._query_postings(queries)
+        # One key per (query, doc) pair, so a single bincount sums every query at once
+        keys, inverse = np.unique(query_numbers * self.num_docs + docs, return_inverse=True)
+        sums = np.bincount(inverse, weights=contributions, minlength=len(keys))
+        bounds = np.searchsorted(keys, np.arange(len(queries) + 1) * self.num_docs)
+        return [
+            (keys[lo:hi] % self.num_docs, sums[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+
+    def top_k_batch(self, queries, top_k):
+        """
+        For each query, its top_k (doc numbers, scores), best first; every
+        matching document when top_k is None.
+        """
+        if top_k is None or not self.num_docs:
+            results = []
+            for docs, scores in self.score_batch(queries):
+                order = np.lexsort((docs, -scores))
+                results.append((docs[order], scores[order]))
+            return results
+
+        # Score a block of queries into one dense (queries x docs) matrix, then
+        # select each row's best k with argpartition. A term shared by several
+        # queries in the block (stopwords, the topic's own words) has its
+        # postings read and scored once and is added to each of their rows.
+        k = min(top_k, self.num_docs)
+        block = max(MIN_SCORE_BLOCK, SCORE_MATRIX_BYTES // (4 * self.num_docs))
+        results = []
+        for lo in range(0, len(queries), block):
+            chunk = queries[lo : lo + block]
+            scores = np.zeros((len(chunk), self.num_docs), dtype=np.float32)
+            for term_id, rows in self._term_rows(chunk).items():
+                docs, contributions = self._term_contributions(term_id)
+                for row in rows:
+                    scores[row, docs] += contributions
+            if k < self.num_docs:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(self.num_docs), scores.shape)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            for row_docs, row_scores in zip(top, top_scores):
+                matched = row_scores > 0
+                row_docs, row_scores = row_docs[matched], row_scores[matched]
+                order = np.lexsort((row_docs, -row_scores))
+                results.append((row_docs[order], row_scores[order]))
+        return results
+
+    def top_k(self, query, top_k):
+        return self.top_k_batch([query], top_k)[0]
+
+
+def ranked_documents(get_document, docs, scores, top_k, filters):
+    results = []
+    for i, score in zip(docs, scores):
+        if len(results) == top_k:
+            break
+        doc = get_document(int(i))
+        if filters and not document_matches_filter(filters, doc):
+            continue
+        results.append(replace(doc, score=float(score)))
+    return results
+
+
+class BM25Index:
+    """Read-only view of an index directory written by BM25Index.build()."""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != INDEX_VERSION:
+            raise ValueError(f"{index_dir} was built by an incompatible version")
+        self.vocab = TermIndex(
+            os.path.join(index_dir, "terms.bin"), os.path.join(index_dir, "term_offsets.npy")
+        )
+        self.k1 = self.meta["k1"]
+        self.b = self.meta["b"]
+        self.num_docs = self.meta["num_docs"]
+        self.avg_doc_length = self.meta["avg_doc_length"]
+        self.offsets = load_array(os.path.join(index_dir, "offsets.npy"))
+        self.postings_docs = load_array(os.path.join(index_dir, "postings_docs.npy"))
+        self.postings_tf = load_array(os.path.join(index_dir, "postings_tf.npy"))
+        self.doc_lengths = load_array(os.path.join(index_dir, "doc_lengths.npy"))
+        self.doc_offsets = load_array(os.path.join(index_dir, "doc_offsets.npy"))
+        self.scorer = BM25Scorer(
+            self.vocab,
+            self.offsets,
+            self.postings_docs,
+            self.postings_tf,
+            self.doc_lengths,
+            k1=self.k1,
+            b=self.b,
+        )
+        self._docs_file = open(os.path.join(index_dir, "docs.jsonl"), "rb")
+        size = os.fstat(self._docs_file.fileno()).st_size
+        self._docs = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @classmethod
+    def build(cls, documents, index_dir, k1=1.5, b=0.75, fingerprint=None):
+        """Write an index for `documents` to `index_dir`, replacing any existing one."""
+        tmp_dir = f"{index_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        vocab, offsets, postings_docs, postings_tf, doc_lengths = build_postings(documents)
+        doc_offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+        with open(os.path.join(tmp_dir, "docs.jsonl"), "wb") as docs_file:
+            for i, doc in enumerate(documents):
+                line = json.dumps(doc.to_dict(flatten=False)).encode("utf-8") + b"\n"
+                docs_file.write(line)
+                doc_offsets[i + 1] = doc_offsets[i] + len(line)
+
+        np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp_dir, "postings_docs.npy"), postings_docs)
+        np.save(os.path.join(tmp_dir, "postings_tf.npy"), postings_tf)
+        np.save(os.path.join(tmp_dir, "doc_lengths.npy"), doc_lengths)
+        np.save(os.path.join(tmp_dir, "doc_offsets.npy"), doc_offsets)
+        TermIndex.write(
+            vocab, os.path.join(tmp_dir, "terms.bin"), os.path.join(tmp_dir, "term_offsets.npy")
+        )
+        meta = {
+            "version": INDEX_VERSION,
+            "k1": k1,
+            "b": b,
+            "num_docs": len(documents),
+            "avg_doc_length": float(doc_lengths.mean()) if len(documents) else 0.0,
+            "num_terms": len(vocab),
+            "num_postings": len(postings_docs),
+            "fingerprint": fingerprint,
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=1)
+
+        replace_dir(tmp_dir, index_dir)
+        return cls(index_dir)
+
+    def close(self):
+        if isinstance(self._docs, mmap.mmap):
+            self._docs.close()
+        self._docs_file.close()
+        self.vocab.close()
+
+    def document(self, i):
+        start, end = self.doc_offsets[i], self.doc_offsets[i + 1]
+        return Document.from_dict(json.loads(self._docs[start:end]))
+
+    def documents(self):
+        return [self.document(i) for i in range(self.num_docs)]
+
+    def search(self, query, top_k=10, filters=None):
+        """Top documents for `query` as Documents with .score set."""
+        return self.search_batch([query], top_k, filters)[0]
+
+    def search_batch(self, queries, top_k=10, filters=None):
+        # With filters some hits get dropped, so rank every match instead of k
+        ranked = self.scorer.top_k_batch(queries, None if filters else top_k)
+        return [
+            ranked_documents(self.document, docs, scores, top_k, filters)
+            for docs, scores in ranked
+        ]
+
+
+class MmapBM25DocumentStore:
+    """
+    Haystack document store backed by a BM25Index directory.
+    Writes and deletes rebuild the index, so it's meant for corpora that are
+    built in bulk (see build()) and then mostly read. There is no append
+    path: writing in many small batches (e.g. ingest.stream_into_store)
+    costs a full rebuild per batch.
+    """
+
+    def __init__(self, index_dir="./bm25_index", k1=1.5, b=0.75):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.index = None
+        if os.path.exists(os.path.join(index_dir, "meta.json")):
+            try:
+                self.index = BM25Index(index_dir)
+            except ValueError:
+                # Built by an older version: no fingerprint, so it gets rebuilt
+                self.index = None
+
+    @property
+    def fingerprint(self):
+        return self.index.meta.get("fingerprint") if self.index else None
+
+    def build(self, documents, fingerprint=None):
+        """Replace the whole index with `documents`."""
+        if self.index is not None:
+            self.index.close()
+        self.index = BM25Index.build(
+            documents, self.index_dir, k1=self.k1, b=self.b, fingerprint=fingerprint
+        )
+
+    def to_dict(self):
+        return default_to_dict(self, index_dir=self.index_dir, k1=self.k1, b=self.b)
+
+    @classmethod
+    def from_dict(cls, data):
+        return default_from_dict(cls, data)
+
+    def count_documents(self):
+        return self.index.num_docs if self.index else 0
+
+    def filter_documents(self, filters=None):
+        docs = self.index.documents() if self.index else []
+        if filters:
+            docs = [doc for doc in docs if document_matches_filter(filters, doc)]
+        return docs
+
+    def write_documents(self, documents, policy=DuplicatePolicy.NONE):
+        """Add `documents` by rebuilding the index with them; see the class docstring."""
+        existing = {doc.id: doc for doc in self.filter_documents()}
+        written = 0
+        for doc in documents:
+            if doc.id in existing:
+                if policy == DuplicatePolicy.SKIP:
+                    continue
+                if policy != DuplicatePolicy.OVERWRITE:
+                    raise DuplicateDocumentError(f"ID '{doc.id}' already exists.")
+            existing[doc.id] = doc
+            written += 1
+        if written:
+            self.build(list(existing.values()))
+        return written
+
+    def delete_documents(self, document_ids):
+        doomed = set(document_ids)
+        docs = self.filter_documents()
+        kept = [doc for doc in docs if doc.id not in doomed]
+        if len(kept) != len(docs):
+            self.build(kept)
+
+    def bm25_retrieval(self, query, top_k=10, filters=None):
+        if self.index is None:
+            return []
+        return self.index.search(query, top_k=top_k, filters=filters)
+
+    def bm25_retrieval_batch(self, queries, top_k=10, filters=None):
+        if self.index is None:
+            return [[] for _ in queries]
+        return self.index.search_batch(queries, top_k=top_k, filters=filters)
+
+
+@component
+class MmapBM25Retriever:
+    """
+    Retriever for an MmapBM25DocumentStore, with the same inputs and outputs as
+    InMemoryBM25Retriever. Scores are Okapi BM25 with a +1 idf (see
+    BM25Scorer), not InMemoryDocumentStore's default BM25L, so scores and
+    rankings differ from that retriever's. Documents that share no terms with
+    the query are left out rather than padding the results up to top_k.
+    """
+
+    def __init__(
+        self,
+        document_store: MmapBM25DocumentStore,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+    ):
+        self.document_store = document_store
+        self.filters = filters
+        self.top_k = top_k
+
+    def to_dict(self):
+        return default_to_dict(
+            self,
+            document_store=self.document_store.to_dict(),
+            filters=self.filters,
+            top_k=self.top_k,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        params = data["init_parameters"]
+        params["document_store"] = MmapBM25DocumentStore.from_dict(params["document_store"])
+        return default_from_dict(cls, data)
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+    ):
+        documents = self.document_store.bm25_retrieval(
+            query,
+            top_k=self.top_k if top_k is None else top_k,
+            filters=filters or self.filters,
+        )
+        return {"documents": documents}
+
+    def run_batch(
+        self,
+        queries: List[str],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+    ):
+        """Like run() for many queries at once; returns one document list per query."""
+        documents = self.document_store.bm25_retrieval_batch(
+            queries,
+            top_k=self.top_k if top_k is None else top_k,
+            filters=filters or self.filters,
+        )
+        return {"documents": documents}
+
+
+@component
+class NumpyBM25Retriever:
+    """
+    BM25 retriever for documents in any document store, e.g. an
+    InMemoryDocumentStore. On warm-up it reads the store's documents into
+    NumPy postings and then scores with BM25Scorer; the postings are rebuilt
+    if the number of documents in the store changes.
+
+    It takes the same inputs as InMemoryBM25Retriever but is not a drop-in
+    for it: it scores Okapi BM25 with a +1 idf, while InMemoryDocumentStore
+    defaults to BM25L (and its BM25Okapi has no +1 and an epsilon idf floor),
+    so scores and rankings differ. The store's bm25_algorithm is ignored.
+    """
+
+    def __init__(
+        self,
+        document_store: Any,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.document_store = document_store
+        self.filters = filters
+        self.top_k = top_k
+        self.k1 = k1
+        self.b = b
+        self._documents = None
+        self._scorer = None
+
+    def to_dict(self):
+        return default_to_dict(
+            self,
+            document_store=self.document_store.to_dict(),
+            filters=self.filters,
+            top_k=self.top_k,
+            k1=self.k1,
+            b=self.b,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        params = data["init_parameters"]
+        store_class = import_class_by_name(params["document_store"]["type"])
+        params["document_store"] = store_class.from_dict(params["document_store"])
+        return default_from_dict(cls, data)
+
+    def warm_up(self):
+        count = self.document_store.count_documents()
+        if self._documents is not None and len(self._documents) == count:
+            return
+        self._documents = self.document_store.filter_documents()
+        vocab, offsets, postings_docs, postings_tf, doc_lengths = build_postings(self._documents)
+        self._scorer = BM25Scorer(
+            vocab, offsets, postings_docs, postings_tf, doc_lengths, k1=self.k1, b=self.b
+        )
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+    ):
+        return {"documents": self.run_batch([query], filters, top_k)["documents"][0]}
+
+    def run_batch(
+        self,
+        queries: List[str],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+    ):
+        """Like run() for many queries at once; returns one document list per query."""
+        self.warm_up()
+        top_k = self.top_k if top_k is None else top_k
+        filters = filters or self.filters
+        ranked = self._scorer.top_k_batch(queries, None if filters else top_k)
+        documents = [
+            ranked_documents(self._documents.__getitem__, docs, scores, top_k, filters)
+            for docs, scores in ranked
+        ]
+        return {"documents": documents}
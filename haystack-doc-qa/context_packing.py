@@ -0,0 +1,173 @@
+"""
+Context packing between the retriever and the PromptBuilder.
+Retrieved chunks overlap (the splitter repeats split_overlap words between
+neighbours) and can repeat each other across files, and pasting them all
+verbatim wastes prompt tokens. ContextPacker:
+
+1. merges chunks of the same source document that overlap or touch into one
+   passage, using the character offsets DocumentSplitter records;
+2. drops near-duplicates, comparing MinHash signatures of word shingles;
+3. keeps the best-scoring passages that fit a token budget, best first.
+"""
+
+import zlib
+from typing import List
+
+import numpy as np
+from haystack import Document, component
+
+from bm25_index import tokenize
+
+# Rough token count, the same chars / 4 estimate the rest of the repo uses
+CHARS_PER_TOKEN = 4
+# Mersenne prime for the MinHash permutations (a * x + b) mod p
+_PRIME = (1 << 61) - 1
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _span(doc):
+    """(start, end) character offsets of a chunk in its source, or None."""
+    start = doc.meta.get("split_idx_start")
+    if start is None or doc.meta.get("source_id") is None:
+        return None
+    return start, start + len(doc.content or "")
+
+
+def merge_overlapping(documents):
+    """
+    Merge chunks of the same source document that overlap or are adjacent.
+    A merged passage keeps the first chunk's meta, lists the split ids it
+    covers under "merged_split_ids", and scores as its best chunk.
+    """
+    by_source = {}
+    loose = []
+    for doc in documents:
+        if _span(doc) is None:
+            loose.append(doc)
+        else:
+            by_source.setdefault(doc.meta["source_id"], []).append(doc)
+
+    merged = []
+    for chunks in by_source.values():
+        chunks.sort(key=lambda doc: doc.meta["split_idx_start"])
+        group = [chunks[0]]
+        end = _span(chunks[0])[1]
+        for chunk in chunks[1:]:
+            start, chunk_end = _span(chunk)
+            if start <= end:
+                group.append(chunk)
+                end = max(end, chunk_end)
+            else:
+                merged.append(_join(group))
+                group, end = [chunk], chunk_end
+        merged.append(_join(group))
+    return merged + loose
+
+
+def _join(group):
+    if len(group) == 1:
+        return group[0]
+    content = group[0].content
+    end = _span(group[0])[1]
+    for chunk in group[1:]:
+        start, chunk_end = _span(chunk)
+        # Only the part past what we already have; a chunk inside it adds nothing
+        if chunk_end > end:
+            content += chunk.content[end - start :]
+            end = chunk_end
+    meta = {key: value for key, value in group[0].meta.items() if key != "_split_overlap"}
+    meta["merged_split_ids"] = [chunk.meta.get("split_id") for chunk in group]
+    scores = [chunk.score for chunk in group if chunk.score is not None]
+    return Document(content=content, meta=meta, score=max(scores) if scores else None)
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, for estimating Jaccard similarity."""
+
+    def __init__(self, num_perm=64, shingle_size=5, seed=0):
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # Below 2**31, so a * hash + b stays inside uint64 for 32-bit hashes
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        words = tokenize(text)
+        n = self.shingle_size
+        shingles = {" ".join(words[i : i + n]) for i in range(max(1, len(words) - n + 1))}
+        hashes = np.array([zlib.crc32(s.encode()) for s in shingles], dtype=np.uint64)
+        return ((hashes[:, None] * self._a + self._b) % _PRIME).min(axis=0)
+
+    @staticmethod
+    def similarity(left, right):
+        return float(np.mean(left == right))
+
+
+def drop_near_duplicates(documents, threshold=0.8, hasher=None):
+    """
+    Keep documents in order, skipping any whose estimated Jaccard similarity
+    to an already kept one is at least `threshold`.
+    """
+    hasher = hasher or MinHasher()
+    kept, signatures = [], []
+    for doc in documents:
+        signature = hasher.signature(doc.content or "")
+        if any(MinHasher.similarity(signature, other) >= threshold for other in signatures):
+            continue
+        kept.append(doc)
+        signatures.append(signature)
+    return kept
+
+
+def _truncate(text, max_tokens):
+    # Cut at a word boundary so the model doesn't see half a word
+    cut = text[: (max_tokens - 1) * CHARS_PER_TOKEN]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > 0 else cut) + " ..."
+
+
+@component
+class ContextPacker:
+    """
+    Merge, dedupe and budget retrieved documents before they reach the prompt.
+    Documents come out best score first. One that doesn't fit the remaining
+    budget is cut to fit when at least `min_tokens` remain, and skipped
+    otherwise, so smaller lower-ranked passages can still use the space.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 1200,
+        min_tokens: int = 64,
+        dedupe_threshold: float = 0.8,
+        num_perm: int = 64,
+        shingle_size: int = 5,
+    ):
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.dedupe_threshold = dedupe_threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document]):
+        passages = merge_overlapping(documents)
+        passages.sort(key=lambda doc: -(doc.score or 0.0))
+        passages = drop_near_duplicates(passages, self.dedupe_threshold, self._hasher)
+
+        packed = []
+        remaining = self.max_tokens
+        for doc in passages:
+            cost = estimate_tokens(doc.content or "")
+            if cost <= remaining:
+                packed.append(doc)
+                remaining -= cost
+            elif remaining >= self.min_tokens:
+                content = _truncate(doc.content, remaining)
+                packed.append(Document(content=content, meta=doc.meta, score=doc.score))
+                remaining -= estimate_tokens(content)
+        return {"documents": packed}
@@ -2,18 +2,33 @@
 """
 Generate Example Tech Blog PDFs for Haystack Q&A Testing
 Creates realistic tech blog content as PDFs for testing the Q&A bot.
+
+With --count it instead builds a synthetic corpus for scale testing: N PDFs
+assembled from the same topics with seeded random variation, built in a
+process pool, plus ground_truth.jsonl mapping questions to the file that
+answers them. Each fact is asked three ways: naming its team ("lexical"),
+reworded without the team ("paraphrase"), and with other words for the
+practice, metric and system ("mismatch"), so retrieval that only matches
+rare words can be told apart from retrieval that matches meaning.
+
+    python generate_example_pdfs.py
+    python generate_example_pdfs.py --count 5000 --sections 12 --out ./synthetic_blogs
 """
 
+import argparse
+import json
 import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
 
 
-def create_pdf_folder():
-    """Create the tech_blogs folder if it doesn't exist."""
-    folder_path = "./tech_blogs"
+def create_pdf_folder(folder_path="./tech_blogs"):
+    """Create the PDF folder if it doesn't exist."""
     os.makedirs(folder_path, exist_ok=True)
     return folder_path
 
@@ -62,9 +77,16 @@ def create_pdf_document(filename, title, content):
     doc.build(story)
 
 
-def generate_async_python_pdf(folder_path):
-    """Generate a PDF about Python async best practices."""
-    filename = os.path.join(folder_path, "python_async_best_practices.pdf")
+def write_topic_pdf(folder_path, topic):
+    """Write a (file stem, title, content) topic to the folder."""
+    stem, title, content = topic
+    filename = os.path.join(folder_path, f"{stem}.pdf")
+    create_pdf_document(filename, title, content)
+    print(f"Created: {filename}")
+
+
+def async_python_topic():
+    """Title and content of the PDF about Python async best practices."""
     title = "Python Async Programming: Best Practices and Patterns"
 
     content = [
@@ -121,14 +143,16 @@ def generate_async_python_pdf(folder_path):
             "text": "Async programming shines in I/O-bound applications but may not provide benefits for CPU-bound tasks. Consider your use case carefully and measure performance to ensure async is the right choice.",
         },
     ]
+    return "python_async_best_practices", title, content
 
-    create_pdf_document(filename, title, content)
-    print(f"Created: {filename}")
 
+def generate_async_python_pdf(folder_path):
+    """Generate a PDF about Python async best practices."""
+    write_topic_pdf(folder_path, async_python_topic())
 
-def generate_python_performance_pdf(folder_path):
-    """Generate a PDF about Python performance optimization."""
-    filename = os.path.join(folder_path, "python_performance_optimization.pdf")
+
+def python_performance_topic():
+    """Title and content of the PDF about Python performance optimization."""
     title = "Python Performance Optimization: A Complete Guide"
 
     content = [
@@ -159,14 +183,16 @@ def generate_python_performance_pdf(folder_path):
             "text": "For I/O-bound operations, async programming can provide significant performance improvements by allowing other operations to proceed while waiting for I/O to complete.",
         },
     ]
+    return "python_performance_optimization", title, content
 
-    create_pdf_document(filename, title, content)
-    print(f"Created: {filename}")
+
+def generate_python_performance_pdf(folder_path):
+    """Generate a PDF about Python performance optimization."""
+    write_topic_pdf(folder_path, python_performance_topic())
 
 
-def generate_web_scraping_pdf(folder_path):
-    """Generate a PDF about web scraping with Python."""
-    filename = os.path.join(folder_path, "python_web_scraping_guide.pdf")
+def web_scraping_topic():
+    """Title and content of the PDF about web scraping with Python."""
     title = "Modern Web Scraping with Python: Async and Beyond"
 
     content = [
@@ -206,14 +232,16 @@ def generate_web_scraping_pdf(folder_path):
             "text": "For large-scale scraping operations, consider using distributed systems, proxy rotation, and database storage for collected data.",
         },
     ]
+    return "python_web_scraping_guide", title, content
 
-    create_pdf_document(filename, title, content)
-    print(f"Created: {filename}")
 
+def generate_web_scraping_pdf(folder_path):
+    """Generate a PDF about web scraping with Python."""
+    write_topic_pdf(folder_path, web_scraping_topic())
 
-def generate_api_design_pdf(folder_path):
-    """Generate a PDF about API design best practices."""
-    filename = os.path.join(folder_path, "api_design_best_practices.pdf")
+
+def api_design_topic():
+    """Title and content of the PDF about API design best practices."""
     title = "RESTful API Design: Best Practices for Modern Applications"
 
     content = [
@@ -246,14 +274,16 @@ def generate_api_design_pdf(folder_path):
             "text": "Implement caching strategies, use pagination for large datasets, and consider async processing for heavy operations to maintain good API performance.",
         },
     ]
+    return "api_design_best_practices", title, content
 
-    create_pdf_document(filename, title, content)
-    print(f"Created: {filename}")
 
+def generate_api_design_pdf(folder_path):
+    """Generate a PDF about API design best practices."""
+    write_topic_pdf(folder_path, api_design_topic())
 
-def generate_microservices_pdf(folder_path):
-    """Generate a PDF about microservices architecture."""
-    filename = os.path.join(folder_path, "microservices_architecture_guide.pdf")
+
+def microservices_topic():
+    """Title and content of the PDF about microservices architecture."""
     title = "Microservices Architecture: Design Patterns and Best Practices"
 
     content = [
@@ -282,12 +312,252 @@ def generate_microservices_pdf(folder_path):
             "text": "Leverage async processing for handling background tasks, processing queues, and managing long-running operations without blocking the main service threads.",
         },
     ]
+    return "microservices_architecture_guide", title, content
 
-    create_pdf_document(filename, title, content)
-    print(f"Created: {filename}")
+
+def generate_microservices_pdf(folder_path):
+    """Generate a PDF about microservices architecture."""
+    write_topic_pdf(folder_path, microservices_topic())
+
+
+TOPICS = [
+    async_python_topic,
+    python_performance_topic,
+    web_scraping_topic,
+    api_design_topic,
+    microservices_topic,
+]
+
+# Things a synthetic team can adopt, per topic; the answers in the ground truth
+PRACTICES = {
+    "python_async_best_practices": [
+        "asyncio.gather for concurrent calls",
+        "a semaphore around outbound requests",
+        "async database drivers",
+        "asyncio.timeout on every await",
+    ],
+    "python_performance_optimization": [
+        "cProfile before every optimization",
+        "sets for membership tests",
+        "a deque for the work queue",
+        "functools.lru_cache on hot lookups",
+    ],
+    "python_web_scraping_guide": [
+        "aiohttp client sessions",
+        "per-domain rate limiting",
+        "proxy rotation",
+        "exponential backoff on retries",
+    ],
+    "api_design_best_practices": [
+        "cursor-based pagination",
+        "ETag response caching",
+        "versioned resource URLs",
+        "consistent error payloads",
+    ],
+    "microservices_architecture_guide": [
+        "a message queue between services",
+        "one database per service",
+        "distributed tracing",
+        "circuit breakers on service calls",
+    ],
+}
+
+TITLE_PREFIXES = ["", "Field Notes: ", "Revisited: ", "A Practical Look at ", "Lessons Learned: "]
+SYSTEMS = ["checkout service", "search backend", "billing pipeline", "mobile API", "ingest workers"]
+METRICS = ["p99 latency", "error rate", "memory usage", "cloud spend", "queue backlog"]
+FILLER = [
+    "In our {system}, {practice} cut {metric} by {n}%.",
+    "We rolled this out across {count} services over {weeks} weeks.",
+    "The main lesson was to measure {metric} before and after every change.",
+    "Adopting {practice} mattered most once traffic passed {rps} requests per second.",
+    "Our {system} team still reviews {metric} every week.",
+]
+# Other words for the practices, metrics and systems, for questions that
+# share little vocabulary with the sentence that answers them
+PRACTICE_SYNONYMS = {
+    "asyncio.gather for concurrent calls": "running coroutines side by side",
+    "a semaphore around outbound requests": "a cap on parallel network traffic",
+    "async database drivers": "non-blocking SQL clients",
+    "asyncio.timeout on every await": "deadlines for each suspended coroutine",
+    "cProfile before every optimization": "measuring hotspots ahead of tuning",
+    "sets for membership tests": "hash-based lookups when checking presence",
+    "a deque for the work queue": "a double-ended list for pending jobs",
+    "functools.lru_cache on hot lookups": "memoizing frequently called helpers",
+    "aiohttp client sessions": "pooled asynchronous HTTP connections",
+    "per-domain rate limiting": "throttling each website separately",
+    "proxy rotation": "cycling through outbound IP addresses",
+    "exponential backoff on retries": "waiting longer between repeated attempts",
+    "cursor-based pagination": "paging with opaque position tokens",
+    "ETag response caching": "conditional GETs with entity tags",
+    "versioned resource URLs": "putting v1 and v2 in endpoint paths",
+    "consistent error payloads": "a uniform shape for failure bodies",
+    "a message queue between services": "brokered asynchronous messaging",
+    "one database per service": "private storage for each component",
+    "distributed tracing": "following requests across hops with spans",
+    "circuit breakers on service calls": "tripping fast when dependencies fail",
+}
+METRIC_SYNONYMS = {
+    "p99 latency": "tail response times",
+    "error rate": "share of failed requests",
+    "memory usage": "RAM footprint",
+    "cloud spend": "hosting bill",
+    "queue backlog": "pile of unprocessed jobs",
+}
+SYSTEM_SYNONYMS = {
+    "checkout service": "payment flow",
+    "search backend": "lookup engine",
+    "billing pipeline": "invoicing jobs",
+    "mobile API": "phone app endpoints",
+    "ingest workers": "data loaders",
+}
+# Team names are built from these, so every fact in the corpus is unique
+SYLLABLES = "ka lo mi ra ven tor sel dun pa qui bex zor fen lu mar tas gri hol nev ost pry wil yan cu".split()
+
+
+def _codename(number, syllables):
+    """A distinct name for every number: its base-24 digits spelled in syllables."""
+    base = len(syllables)
+    space = base**3
+    # Scramble within each block of 24**3 (7919 is coprime to it, so still
+    # one-to-one) so neighbouring numbers don't share syllables
+    number = number // space * space + (number % space * 7919 + 12345) % space
+    parts = []
+    while number or len(parts) < 3:
+        number, digit = divmod(number, base)
+        parts.append(syllables[digit])
+    return "".join(parts).capitalize()
+
+
+def _sections(content):
+    """Split a topic's content into [heading, body...] groups."""
+    groups = []
+    for item in content:
+        if item["type"] == "heading" or not groups:
+            groups.append([])
+        groups[-1].append(item)
+    return groups
+
+
+def _filler(rng, practices, sentences):
+    return " ".join(
+        rng.choice(FILLER).format(
+            system=rng.choice(SYSTEMS),
+            practice=rng.choice(practices),
+            metric=rng.choice(METRICS),
+            n=rng.randint(5, 80),
+            count=rng.randint(2, 40),
+            weeks=rng.randint(1, 12),
+            rps=rng.choice([500, 1000, 5000, 20000]),
+        )
+        for _ in range(sentences)
+    )
 
 
-def main():
+def synthetic_topic(index, seed=0, sections=8, facts=2):
+    """
+    The (file stem, title, content) of synthetic document `index`, and its
+    ground-truth questions. Depends only on `index` and `seed`, so the corpus
+    is the same whichever worker builds which file.
+    """
+    rng = random.Random(f"{seed}:{index}")
+    stem, title, content = rng.choice(TOPICS)()
+    stem = f"synthetic_{index:05d}_{stem}"
+    practices = PRACTICES[stem.split("_", 2)[2]]
+    groups = _sections(content)
+
+    body = []
+    for _ in range(sections):
+        body.extend(rng.choice(groups))
+        body.append({"type": "paragraph", "text": _filler(rng, practices, rng.randint(3, 6))})
+
+    ground_truth = []
+    syllables = random.Random(seed).sample(SYLLABLES, len(SYLLABLES))
+    for fact in range(facts):
+        team = _codename(index * facts + fact, syllables)
+        practice = rng.choice(practices)
+        metric = rng.choice(METRICS)
+        system = rng.choice(SYSTEMS)
+        drop = rng.randint(10, 90)
+        text = (
+            f"The {team} team adopted {practice} in the {system} "
+            f"and saw {metric} drop by {drop} percent."
+        )
+        body.insert(rng.randint(0, len(body)), {"type": "paragraph", "text": text})
+        questions = [
+            ("lexical", f"What did the {team} team adopt to reduce {metric}?", practice),
+            (
+                "paraphrase",
+                f"Which team's {metric} fell {drop} percent once it started using "
+                f"{practice} in the {system}?",
+                team,
+            ),
+            (
+                "mismatch",
+                f"Who got their {METRIC_SYNONYMS[metric]} down {drop}% by switching to "
+                f"{PRACTICE_SYNONYMS[practice]} for the {SYSTEM_SYNONYMS[system]}?",
+                team,
+            ),
+        ]
+        for kind, question, answer in questions:
+            ground_truth.append(
+                {
+                    "question": question,
+                    "kind": kind,
+                    "answer": answer,
+                    "file": f"{stem}.pdf",
+                    "evidence": text,
+                }
+            )
+    return (stem, rng.choice(TITLE_PREFIXES) + title, body), ground_truth
+
+
+def _build_synthetic(folder_path, index, seed, sections, facts):
+    topic, ground_truth = synthetic_topic(index, seed, sections, facts)
+    stem, title, content = topic
+    create_pdf_document(os.path.join(folder_path, f"{stem}.pdf"), title, content)
+    return ground_truth
+
+
+def generate_corpus(folder_path, count, sections=8, facts=2, seed=0, workers=None):
+    """
+    Build `count` synthetic PDFs in a process pool and write
+    ground_truth.jsonl next to them. Returns stats.
+    """
+    create_pdf_folder(folder_path)
+    started = time.perf_counter()
+    args = [[folder_path] * count, range(count), [seed] * count, [sections] * count, [facts] * count]
+    if count > 1 and workers != 1:
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Several files per task, so the pool isn't mostly IPC
+            chunksize = max(1, count // (workers * 8))
+            results = list(pool.map(_build_synthetic, *args, chunksize=chunksize))
+    else:
+        results = list(map(_build_synthetic, *args))
+
+    # Questions that don't name a team can fit facts in several files; any of
+    # them counts as a hit
+    files = {}
+    for records in results:
+        for record in records:
+            files.setdefault(record["question"], []).append(record["file"])
+    ground_truth_path = os.path.join(folder_path, "ground_truth.jsonl")
+    with open(ground_truth_path, "w") as f:
+        for records in results:
+            for record in records:
+                record["files"] = sorted(set(files[record["question"]]))
+                f.write(json.dumps(record) + "\n")
+    seconds = time.perf_counter() - started
+    return {
+        "files": count,
+        "questions": sum(len(records) for records in results),
+        "ground_truth": ground_truth_path,
+        "seconds": round(seconds, 3),
+        "files_per_second": round(count / seconds, 1) if seconds else None,
+    }
+
+
+def generate_examples():
     """Generate all example PDFs."""
     print("Generating example tech blog PDFs...")
 
@@ -312,6 +582,27 @@ def main():
     print("\nYou can now run the Haystack Q&A script!")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Generate tech blog PDFs for the Q&A bot.")
+    parser.add_argument(
+        "--count", type=int, default=None, help="build a synthetic corpus of this many PDFs"
+    )
+    parser.add_argument("--out", default="./synthetic_blogs", help="with --count")
+    parser.add_argument("--sections", type=int, default=8, help="sections per synthetic PDF")
+    parser.add_argument("--facts", type=int, default=2, help="facts per PDF, asked three ways each")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="default: CPU count")
+    args = parser.parse_args()
+
+    if args.count is None:
+        generate_examples()
+        return
+    stats = generate_corpus(
+        args.out, args.count, args.sections, args.facts, args.seed, args.workers
+    )
+    print(json.dumps(stats, indent=2))
+
+
 if __name__ == "__main__":
     try:
         main()
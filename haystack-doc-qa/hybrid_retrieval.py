@@ -0,0 +1,435 @@
+"""
+Hybrid BM25 + dense retrieval that runs on CPU with no network.
+Chunks are embedded by LocalEmbedder (hashed word and character n-gram
+features, projected onto LSA components fitted on the corpus itself). The
+vectors are stored int8-quantized in a directory next to the BM25 index:
+
+    meta.json      fingerprint and sizes
+    embedder.npz   embedder settings, bucket idf weights and LSA projection
+    codes.npy      int8 vectors, one row per document, in BM25 index order
+    scales.npy     float32 per-row scale; vector ~= codes * scale
+
+HybridRetriever runs the BM25 and the dense search side by side and, when
+BM25 has no clear winner, merges the two rankings with weighted
+reciprocal-rank fusion (keeping BM25's best hit first), so a chunk that
+paraphrases the question can still reach the top k. It is opt-in (RETRIEVER=hybrid in haystack_pdf_qa.py): on
+questions that name rare terms the local embedder ranks chunks close to
+randomly, and unweighted fusion let that noise push out BM25's exact hits.
+"""
+
+import json
+import os
+import shutil
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from haystack import Document, component, default_from_dict, default_to_dict
+
+from bm25_index import (
+    MmapBM25DocumentStore,
+    load_array,
+    ranked_documents,
+    replace_dir,
+    tokenize,
+)
+
+INDEX_VERSION = 1
+# Constant from the original RRF paper; larger values flatten the rank curve
+RRF_K = 60
+# Weight of the BM25 ranking in the fusion, relative to the dense one
+SPARSE_WEIGHT = 2.0
+# BM25's ranking is kept as is when its best score beats the second best by
+# this factor. On the synthetic benchmark that holds for 96% of the questions
+# that name a team and 47% of the reworded ones
+CONFIDENT_RATIO = 1.05
+# Documents embedded per block and sampled to fit the LSA projection
+EMBED_BLOCK = 4096
+FIT_SAMPLE = 20000
+# Rows dequantized per matrix product during search; a block stays in cache
+SEARCH_BLOCK = 1024
+
+
+def _ragged_indices(starts, lengths):
+    """Flat indices of [starts[i], starts[i] + lengths[i]) for every i."""
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalEmbedder:
+    """
+    Feature-hashing embedder with an optional LSA projection.
+    Every word contributes itself plus its character n-grams, hashed into
+    `dim` signed buckets, so inflections and compounds ("async",
+    "asynchronous") land close together. fit() learns bucket idf weights and,
+    given enough documents, the top `components` LSA directions, which also
+    pull together words that occur in the same contexts.
+    """
+
+    def __init__(self, dim=2048, components=128, ngram_range=(3, 5), idf=None, projection=None):
+        self.dim = dim
+        self.components = components
+        self.ngram_range = tuple(ngram_range)
+        self.idf = idf
+        self.projection = projection
+        self._features = {}
+
+    @property
+    def output_dim(self):
+        return self.dim if self.projection is None else self.projection.shape[1]
+
+    def _word_features(self, word):
+        """(buckets, signed weights) for one word, cached."""
+        features = self._features.get(word)
+        if features is None:
+            padded = f"<{word}>"
+            low, high = self.ngram_range
+            grams = [
+                padded[i : i + n] for n in range(low, high + 1) for i in range(len(padded) - n + 1)
+            ]
+            hashes = np.array(
+                [zlib.crc32(f"w:{word}".encode())] + [zlib.crc32(g.encode()) for g in grams],
+                dtype=np.uint32,
+            )
+            # The whole word weighs 1 and its n-grams share another 1
+            weights = np.full(len(hashes), 1.0 / max(1, len(grams)), dtype=np.float32)
+            weights[0] = 1.0
+            weights[hashes >> 31 == 1] *= -1
+            features = ((hashes % self.dim).astype(np.int64), weights)
+            self._features[word] = features
+        return features
+
+    def _hashed(self, texts):
+        """Raw (len(texts), dim) hashed term-frequency matrix."""
+        rows, word_numbers, tf = [], [], []
+        words = {}
+        for row, text in enumerate(texts):
+            for word, count in Counter(tokenize(text)).items():
+                rows.append(row)
+                word_numbers.append(words.setdefault(word, len(words)))
+                tf.append(count)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not words:
+            return matrix
+
+        # Block-local CSR of the features of every distinct word
+        features = [self._word_features(word) for word in words]
+        lengths = np.array([len(buckets) for buckets, _ in features])
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        buckets = np.concatenate([buckets for buckets, _ in features])
+        weights = np.concatenate([weights for _, weights in features])
+
+        word_numbers = np.array(word_numbers)
+        counts = lengths[word_numbers]
+        picked = _ragged_indices(offsets[word_numbers], counts)
+        scale = np.repeat(1 + np.log(np.array(tf, dtype=np.float32)), counts)
+        matrix += np.bincount(
+            np.repeat(np.array(rows, dtype=np.int64), counts) * self.dim + buckets[picked],
+            weights=weights[picked] * scale,
+            minlength=len(texts) * self.dim,
+        ).reshape(len(texts), self.dim)
+        return matrix
+
+    def fit(self, texts, seed=0):
+        if len(texts) > FIT_SAMPLE:
+            picked = np.sort(np.random.default_rng(seed).choice(len(texts), FIT_SAMPLE, replace=False))
+            texts = [texts[i] for i in picked]
+        blocks = [self._hashed(texts[lo : lo + EMBED_BLOCK]) for lo in range(0, len(texts), EMBED_BLOCK)]
+        doc_freq = sum((np.count_nonzero(block, axis=0) for block in blocks), np.zeros(self.dim))
+        self.idf = (np.log((1 + len(texts)) / (1 + doc_freq)) + 1).astype(np.float32)
+        self.projection = None
+        # With only a handful of chunks LSA has nothing to learn from, and
+        # projecting would throw away most of the lexical detail
+        if len(texts) >= 2 * self.components:
+            gram = np.zeros((self.dim, self.dim), dtype=np.float32)
+            for block in blocks:
+                weighted = _normalize(block * self.idf)
+                gram += weighted.T @ weighted
+            _, eigenvectors = np.linalg.eigh(gram)
+            self.projection = np.ascontiguousarray(eigenvectors[:, ::-1][:, : self.components])
+        return self
+
+    def embed(self, texts):
+        """Unit-length float32 vectors for `texts`."""
+        blocks = [
+            self._embed_block(texts[lo : lo + EMBED_BLOCK])
+            for lo in range(0, len(texts), EMBED_BLOCK)
+        ]
+        return np.concatenate(blocks) if blocks else np.zeros((0, self.output_dim), np.float32)
+
+    def _embed_block(self, texts):
+        vectors = _normalize(self._hashed(texts) * self.idf)
+        if self.projection is not None:
+            vectors = _normalize(vectors @ self.projection)
+        return vectors.astype(np.float32)
+
+    def save(self, path):
+        np.savez(
+            path,
+            dim=self.dim,
+            components=self.components,
+            ngram_range=np.array(self.ngram_range),
+            idf=self.idf,
+            projection=self.projection if self.projection is not None else np.zeros((0, 0)),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            projection = data["projection"]
+            return cls(
+                dim=int(data["dim"]),
+                components=int(data["components"]),
+                ngram_range=tuple(int(n) for n in data["ngram_range"]),
+                idf=data["idf"],
+                projection=projection.astype(np.float32) if projection.size else None,
+            )
+
+
+def quantize_int8(vectors):
+    """(codes, scales) with one symmetric scale per row."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def stored_fingerprint(index_dir):
+    """Fingerprint of the dense index in `index_dir`, or None if there isn't one."""
+    try:
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            return json.load(f).get("fingerprint")
+    except (OSError, ValueError):
+        return None
+
+
+class DenseIndex:
+    """Read-only view of an index directory written by DenseIndex.build()."""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != INDEX_VERSION:
+            raise ValueError(f"{index_dir} was built by an incompatible version")
+        self.num_docs = self.meta["num_docs"]
+        self.fingerprint = self.meta.get("fingerprint")
+        self.embedder = LocalEmbedder.load(os.path.join(index_dir, "embedder.npz"))
+        self.codes = load_array(os.path.join(index_dir, "codes.npy"))
+        self.scales = np.load(os.path.join(index_dir, "scales.npy"))
+
+    @classmethod
+    def build(cls, documents, index_dir, fingerprint=None, **embedder_kwargs):
+        """
+        Fit an embedder on `documents` and write their quantized vectors to
+        `index_dir`, replacing any existing index. Documents must be in the
+        same order as in the BM25 index they are paired with.
+        """
+        tmp_dir = f"{index_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        texts = [doc.content or "" for doc in documents]
+        embedder = LocalEmbedder(**embedder_kwargs).fit(texts)
+        codes = np.zeros((len(texts), embedder.output_dim), dtype=np.int8)
+        scales = np.zeros(len(texts), dtype=np.float32)
+        for lo in range(0, len(texts), EMBED_BLOCK):
+            block_codes, block_scales = quantize_int8(embedder.embed(texts[lo : lo + EMBED_BLOCK]))
+            codes[lo : lo + len(block_codes)] = block_codes
+            scales[lo : lo + len(block_scales)] = block_scales
+
+        embedder.save(os.path.join(tmp_dir, "embedder.npz"))
+        np.save(os.path.join(tmp_dir, "codes.npy"), codes)
+        np.save(os.path.join(tmp_dir, "scales.npy"), scales)
+        meta = {
+            "version": INDEX_VERSION,
+            "num_docs": len(texts),
+            "dim": embedder.output_dim,
+            "fingerprint": fingerprint,
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=1)
+        replace_dir(tmp_dir, index_dir)
+        return cls(index_dir)
+
+    def scores(self, vectors):
+        """(num_docs, len(vectors)) cosine similarities."""
+        scores = np.empty((self.num_docs, len(vectors)), dtype=np.float32)
+        query = np.ascontiguousarray(vectors.T)
+        for lo in range(0, self.num_docs, SEARCH_BLOCK):
+            hi = min(lo + SEARCH_BLOCK, self.num_docs)
+            np.matmul(self.codes[lo:hi].astype(np.float32), query, out=scores[lo:hi])
+            scores[lo:hi] *= self.scales[lo:hi, None]
+        return scores
+
+    def top_k_batch(self, queries, top_k):
+        """
+        For each query, its top_k (doc numbers, scores), best first, leaving
+        out documents with no positive similarity; all of them when top_k is None.
+        """
+        if not self.num_docs:
+            return [(np.empty(0, np.int64), np.empty(0, np.float32)) for _ in queries]
+        results = []
+        for column in self.scores(self.embedder.embed(queries)).T:
+            if top_k is not None and top_k < self.num_docs:
+                docs = np.argpartition(-column, top_k - 1)[:top_k]
+            else:
+                docs = np.arange(self.num_docs)
+            scores = column[docs]
+            matched = scores > 0
+            docs, scores = docs[matched], scores[matched]
+            order = np.lexsort((docs, -scores))
+            results.append((docs[order], scores[order]))
+        return results
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, weights=None):
+    """
+    Merge rankings of doc numbers (each best first) into (doc numbers, scores),
+    best first. A document scores sum(weight / (k + rank)) over the rankings
+    it is in; every weight is 1 unless `weights` says otherwise.
+    """
+    rankings = [np.asarray(ranking, dtype=np.int64) for ranking in rankings]
+    weights = [1.0] * len(rankings) if weights is None else weights
+    docs = np.concatenate(rankings)
+    contributions = np.concatenate(
+        [
+            weight / (k + np.arange(1, len(ranking) + 1))
+            for ranking, weight in zip(rankings, weights)
+        ]
+    )
+    keys, inverse = np.unique(docs, return_inverse=True)
+    scores = np.bincount(inverse, weights=contributions, minlength=len(keys))
+    order = np.lexsort((keys, -scores))
+    return keys[order], scores[order]
+
+
+def _pin_first(docs, scores, doc):
+    """Move `doc` to the front of a fused ranking, with the top fused score."""
+    rest = docs != doc
+    return np.concatenate([[doc], docs[rest]]), np.concatenate([scores[:1], scores[rest]])
+
+
+@component
+class HybridRetriever:
+    """
+    BM25 over an MmapBM25DocumentStore plus dense search over a DenseIndex
+    built from the same documents, fused with reciprocal-rank fusion.
+    Each side contributes its best `candidates` documents, BM25's weighted by
+    `sparse_weight`, and the returned documents carry the fused score.
+    BM25's best hit stays first either way: two middling ranks can outscore
+    it (2/70 + 1/70 > 2/61). When BM25's top score is at least
+    `confident_ratio` times its runner-up, the BM25 ranking is returned
+    unchanged (with BM25 scores) instead. The dense search runs on a worker
+    thread while BM25 runs on the caller's, and both spend most of their
+    time in NumPy, which releases the GIL.
+    """
+
+    def __init__(
+        self,
+        document_store: MmapBM25DocumentStore,
+        dense_index_dir: str = "./dense_index",
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 5,
+        candidates: int = 20,
+        rrf_k: int = RRF_K,
+        sparse_weight: float = SPARSE_WEIGHT,
+        confident_ratio: float = CONFIDENT_RATIO,
+    ):
+        self.document_store = document_store
+        self.dense_index_dir = dense_index_dir
+        self.filters = filters
+        self.top_k = top_k
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.sparse_weight = sparse_weight
+        self.confident_ratio = confident_ratio
+        self._dense = None
+        self._pool = None
+
+    def to_dict(self):
+        return default_to_dict(
+            self,
+            document_store=self.document_store.to_dict(),
+            dense_index_dir=self.dense_index_dir,
+            filters=self.filters,
+            top_k=self.top_k,
+            candidates=self.candidates,
+            rrf_k=self.rrf_k,
+            sparse_weight=self.sparse_weight,
+            confident_ratio=self.confident_ratio,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        params = data["init_parameters"]
+        params["document_store"] = MmapBM25DocumentStore.from_dict(params["document_store"])
+        return default_from_dict(cls, data)
+
+    def warm_up(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dense")
+        # Reopen after the BM25 store was rebuilt, so doc numbers stay paired
+        if self._dense is None or self._dense.fingerprint != self.document_store.fingerprint:
+            self._dense = DenseIndex(self.dense_index_dir)
+        if self._dense.num_docs != self.document_store.count_documents():
+            raise ValueError(
+                f"{self.dense_index_dir} has {self._dense.num_docs} documents but the BM25 "
+                f"store has {self.document_store.count_documents()}; rebuild the dense index"
+            )
+
+    def _confident(self, sparse_scores):
+        """True when BM25's best hit clearly beats its second, or is the only one."""
+        if len(sparse_scores) == 0:
+            return False
+        if len(sparse_scores) == 1:
+            return True
+        return sparse_scores[0] >= self.confident_ratio * sparse_scores[1]
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+    ):
+        return {"documents": self.run_batch([query], filters, top_k)["documents"][0]}
+
+    def run_batch(
+        self,
+        queries: List[str],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+    ):
+        """Like run() for many queries at once; returns one document list per query."""
+        index = self.document_store.index
+        if index is None:
+            return {"documents": [[] for _ in queries]}
+        self.warm_up()
+        top_k = self.top_k if top_k is None else top_k
+        filters = filters or self.filters
+        # With filters some hits get dropped, so fuse every match instead of a shortlist
+        depth = None if filters else max(self.candidates, top_k)
+
+        dense = self._pool.submit(self._dense.top_k_batch, queries, depth)
+        sparse = index.scorer.top_k_batch(queries, depth)
+        documents = []
+        for (sparse_docs, sparse_scores), (dense_docs, _) in zip(sparse, dense.result()):
+            if self._confident(sparse_scores):
+                docs, scores = sparse_docs, sparse_scores
+            else:
+                docs, scores = reciprocal_rank_fusion(
+                    [sparse_docs, dense_docs], k=self.rrf_k, weights=[self.sparse_weight, 1.0]
+                )
+                if len(sparse_docs):
+                    docs, scores = _pin_first(docs, scores, sparse_docs[0])
+            documents.append(ranked_documents(index.document, docs, scores, top_k, filters))
+        return {"documents": documents}
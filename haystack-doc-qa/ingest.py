@@ -0,0 +1,257 @@
+"""
+Parallel, cached PDF ingestion.
+PDFs are converted and split in a process pool. The resulting chunks are
+cached on disk as JSON. A manifest records each file's size, mtime and
+sha256, so on the next start unchanged PDFs are loaded from the cache instead
+of being parsed again. Workers stream pages through streaming_pdf, so a
+worker's memory doesn't grow with the size of the PDF.
+
+`--stream` is a measurement mode: it streams chunks into a throwaway
+InMemoryDocumentStore to report time to first batch and peak memory, and
+keeps nothing. The on-disk MmapBM25DocumentStore rebuilds its index on every
+write, so it isn't a target for streaming; build it in bulk from the cache.
+
+    python ingest.py ./tech_blogs --workers 8
+    python ingest.py ./tech_blogs --stream --batch-size 256
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from haystack import Document
+from haystack.document_stores.in_memory import InMemoryDocumentStore
+
+from streaming_pdf import StreamingWordSplitter, iter_chunks, iter_pages, write_in_batches
+
+CACHE_DIR = os.getenv("INGEST_CACHE_DIR", "./.ingest_cache")
+MANIFEST_FILE = "manifest.json"
+# Bump when the cached format or the conversion itself changes
+CACHE_VERSION = 2
+
+DEFAULT_SPLIT = {"split_by": "word", "split_length": 200, "split_overlap": 20}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_name(sha256, split):
+    # The split settings are part of the key, so changing them re-splits everything
+    settings = json.dumps({"v": CACHE_VERSION, **split}, sort_keys=True)
+    return f"{sha256}-{hashlib.sha256(settings.encode()).hexdigest()[:12]}.json"
+
+
+class Manifest:
+    """path -> {size, mtime, sha256, cache}, saved as JSON in the cache dir."""
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, MANIFEST_FILE)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def file_versions(cache_dir=CACHE_DIR):
+    """
+    file name -> sha256 for every PDF in the manifest. Chunks only record the
+    file name (meta["file_path"]), so that's the key.
+    """
+    return {
+        os.path.basename(path): entry["sha256"]
+        for path, entry in Manifest(cache_dir).entries.items()
+    }
+
+
+# Set once per worker process by _init_worker
+_splitter = None
+
+
+def _init_worker(split):
+    global _splitter
+    _splitter = StreamingWordSplitter(**split)
+
+
+def _convert_and_split(path, cache_path, sha256):
+    """
+    Runs in a worker: stream one PDF's chunks into its cache file. Only the
+    chunk count goes back to the parent, which reads the file if it needs the
+    chunks, so they aren't pickled across the process boundary as well.
+    """
+    meta = {"file_path": os.path.basename(path), "source_id": sha256}
+    count = 0
+    with open(cache_path + ".tmp", "w") as f:
+        f.write("[")
+        for chunk in _splitter.split(iter_pages(path), meta):
+            if count:
+                f.write(",")
+            json.dump(chunk.to_dict(), f)
+            count += 1
+        f.write("]")
+    os.replace(cache_path + ".tmp", cache_path)
+    return count
+
+
+def _load_cached(cache_path):
+    with open(cache_path) as f:
+        return [Document.from_dict(data) for data in json.load(f)]
+
+
+def ingest_pdfs(paths, cache_dir=CACHE_DIR, workers=None, split=None, load=True):
+    """
+    Convert and split `paths`, reusing cached chunks for unchanged files.
+    Returns (documents, stats); documents are in the order of `paths`.
+    stats["fingerprint"] changes whenever the resulting chunks would. With
+    load=False cached files aren't read back and no documents are returned,
+    which is enough to refresh the cache and check an index against it.
+    """
+    split = {**DEFAULT_SPLIT, **(split or {})}
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = Manifest(cache_dir)
+    started = time.perf_counter()
+
+    stats = {"files": len(paths), "cached": 0, "parsed": 0, "failed": 0, "errors": {}}
+    results = {}
+    pending = {}
+    entries = {}
+    for path in paths:
+        stat = os.stat(path)
+        entry = manifest.entries.get(path)
+        if not (entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime):
+            # Size or mtime moved: hash to tell a real edit from a touch or copy
+            entry = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": file_sha256(path)}
+        entry["cache"] = _cache_name(entry["sha256"], split)
+        entries[path] = entry
+        cache_path = os.path.join(cache_dir, entry["cache"])
+        if os.path.exists(cache_path):
+            if load:
+                results[path] = _load_cached(cache_path)
+            stats["cached"] += 1
+        else:
+            pending[path] = (cache_path, entry["sha256"])
+
+    # Not worth starting a pool for a single file
+    run = _run_pool if len(pending) > 1 else _run_inline
+    for path, _, error in run(pending, split, workers):
+        if error is not None:
+            stats["failed"] += 1
+            stats["errors"][path] = f"{type(error).__name__}: {error}"
+            entries.pop(path)
+            continue
+        if load:
+            results[path] = _load_cached(pending[path][0])
+        stats["parsed"] += 1
+
+    # Files that disappeared drop out of the manifest; their cache files are
+    # removed unless another path has the same content
+    live = {entry["cache"] for entry in entries.values()}
+    for path, entry in manifest.entries.items():
+        if path not in entries and entry.get("cache") not in live:
+            try:
+                os.remove(os.path.join(cache_dir, entry["cache"]))
+            except OSError:
+                pass
+    manifest.entries = entries
+    manifest.save()
+
+    stats["fingerprint"] = hashlib.sha256(
+        json.dumps([[path, entries[path]["cache"]] for path in paths if path in entries]).encode()
+    ).hexdigest()
+    documents = [doc for path in paths if path in results for doc in results[path]]
+    stats["chunks"] = len(documents)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return documents, stats
+
+
+def _run_inline(pending, split, workers=None):
+    if not pending:
+        return
+    _init_worker(split)
+    for path, (cache_path, sha256) in pending.items():
+        try:
+            yield path, _convert_and_split(path, cache_path, sha256), None
+        except Exception as exc:
+            yield path, None, exc
+
+
+def _run_pool(pending, split, workers):
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(split,)
+    ) as pool:
+        futures = {
+            pool.submit(_convert_and_split, path, cache_path, sha256): path
+            for path, (cache_path, sha256) in pending.items()
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as exc:
+                yield futures[future], None, exc
+
+
+def stream_into_store(paths, document_store, split=None, batch_size=256):
+    """
+    Stream `paths` straight into `document_store`, `batch_size` chunks at a
+    time and without the cache. With a store that indexes writes
+    incrementally, such as InMemoryDocumentStore, the first chunks of a large
+    PDF can be searched long before the whole file is read. Don't pass an
+    MmapBM25DocumentStore: each batch would rebuild its whole index. Returns
+    stats like ingest_pdfs, plus "first_batch_seconds".
+    """
+    split = {**DEFAULT_SPLIT, **(split or {})}
+    started = time.perf_counter()
+    stats = {"files": len(paths), "chunks": 0, "first_batch_seconds": None}
+    for path in paths:
+        file_started = time.perf_counter()
+        chunks = iter_chunks(path, file_sha256(path), split)
+        written, first_batch = write_in_batches(chunks, document_store, batch_size)
+        stats["chunks"] += written
+        if stats["first_batch_seconds"] is None and first_batch is not None:
+            stats["first_batch_seconds"] = round(file_started - started + first_batch, 3)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert and split PDFs into the cache.")
+    parser.add_argument("folder", nargs="?", default="./tech_blogs")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="default: CPU count")
+    parser.add_argument("--split-length", type=int, default=DEFAULT_SPLIT["split_length"])
+    parser.add_argument("--split-overlap", type=int, default=DEFAULT_SPLIT["split_overlap"])
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="measure streaming into a throwaway in-memory store; nothing is kept",
+    )
+    parser.add_argument("--batch-size", type=int, default=256, help="with --stream")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.folder, "*.pdf")))
+    split = {"split_length": args.split_length, "split_overlap": args.split_overlap}
+    if args.stream:
+        stats = stream_into_store(paths, InMemoryDocumentStore(), split, args.batch_size)
+        # ru_maxrss is in KiB on Linux
+        stats["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    else:
+        _, stats = ingest_pdfs(paths, cache_dir=args.cache_dir, workers=args.workers, split=split)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
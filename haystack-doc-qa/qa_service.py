@@ -0,0 +1,386 @@
+"""
+Long-running Q&A service over the tech blog PDFs.
+The indexes and the pipeline are built once at startup, then queries arrive
+over HTTP or as JSON lines on stdin. Queries that arrive together are
+retrieved with one batched retriever call, and answers are generated
+concurrently (at most QA_MAX_CONCURRENCY at a time), streaming tokens as the
+model writes them. Identical questions that retrieved the same documents
+while one is still being answered wait for that answer instead of asking
+the model again.
+
+    uvicorn qa_service:app --port 8000
+
+    curl -X POST localhost:8000/ask -H 'Content-Type: application/json' \\
+        -d '{"query": "What is the best practice for async in Python?"}'
+    curl -N -X POST localhost:8000/ask/stream -H 'Content-Type: application/json' \\
+        -d '{"query": "How do I keep Docker images small?"}'
+
+    echo '{"id": 1, "query": "How should I version an API?"}' | python qa_service.py --stdin
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, redirect_stdout
+from functools import partial
+from typing import List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from answer_cache import make_cache_key
+from haystack_pdf_qa import build_answer_cache, build_document_store, build_pipeline
+from singleflight import SingleFlight
+
+MAX_CONCURRENCY = int(os.getenv("QA_MAX_CONCURRENCY", "8"))
+BATCH_WINDOW_SECONDS = float(os.getenv("QA_BATCH_WINDOW_MS", "5")) / 1000
+MAX_BATCH = int(os.getenv("QA_MAX_BATCH", "32"))
+TOP_K = int(os.getenv("QA_TOP_K", "5"))
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class RetrievalBatcher:
+    """
+    Collects queries that arrive within `window` seconds of each other (or
+    until `max_batch` are waiting) and retrieves them with one run_batch
+    call, on a worker thread so the event loop keeps serving.
+    """
+
+    def __init__(self, retriever, window=BATCH_WINDOW_SECONDS, max_batch=MAX_BATCH):
+        self.retriever = retriever
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self.batches = 0
+        self.queries = 0
+
+    async def retrieve(self, query, top_k):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((query, top_k, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        # run_batch takes a single top_k, so split the batch by it
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[1], []).append(item)
+        for top_k, items in groups.items():
+            asyncio.ensure_future(self._run(top_k, items))
+
+    async def _run(self, top_k, items):
+        self.batches += 1
+        self.queries += len(items)
+        try:
+            result = await asyncio.to_thread(
+                self.retriever.run_batch, [query for query, _, _ in items], top_k=top_k
+            )
+        except Exception as exc:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, _, future), documents in zip(items, result["documents"]):
+            if not future.done():
+                future.set_result(documents)
+
+
+def _source(doc):
+    return {"file_path": doc.meta.get("file_path", "Unknown"), "score": doc.score}
+
+
+class QAService:
+    """
+    The pipeline built by haystack_pdf_qa, driven one component at a time:
+    retrieval goes through the batcher, the packer and prompt builder run
+    inline, and the generator runs on its own thread pool. Answer cache
+    lookups and writes (SQLite) run on worker threads too, so they don't
+    stall the event loop.
+    """
+
+    def __init__(self):
+        self.pipeline = None
+        self.retriever = None
+        self.packer = None
+        self.prompt_builder = None
+        self.llm = None
+        self.cache = None
+        self.batcher = None
+        # Keyed like the answer cache: normalized query plus retrieved doc ids
+        self.inflight = SingleFlight()
+        self.semaphore = None
+        self._executor = None
+        self.in_flight = 0
+        self.answered = 0
+        self.started = time.time()
+
+    def load(self, folder="./tech_blogs"):
+        pipeline = build_pipeline(build_document_store(folder))
+        self.setup(pipeline, cache=build_answer_cache())
+
+    def setup(self, pipeline, cache=None, max_concurrency=MAX_CONCURRENCY):
+        pipeline.warm_up()
+        self.cache = cache
+        self.pipeline = pipeline
+        self.retriever = pipeline.get_component("retriever")
+        self.packer = pipeline.get_component("packer")
+        self.prompt_builder = pipeline.get_component("prompt_builder")
+        self.llm = pipeline.get_component("llm")
+        self.batcher = RetrievalBatcher(self.retriever)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # OpenAIGenerator.run blocks, so each concurrent call needs a thread
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+
+    async def answer(self, query, top_k=None, on_token=None):
+        """
+        Answer one query. `on_token(text)` is called on the event loop for each
+        streamed chunk of the reply.
+        """
+        started = time.perf_counter()
+        retrieved = await self.batcher.retrieve(query, top_k or TOP_K)
+        key = make_cache_key(query, retrieved)
+        joined = key in self.inflight
+        result = await self.inflight.do(key, lambda: self._generate(query, retrieved, on_token))
+        if joined:
+            # Another request produced the reply, so it arrives in one piece
+            if on_token is not None:
+                on_token(result["answer"])
+            result["cache"] = "coalesced"
+        self.answered += 1
+        return {**result, "seconds": round(time.perf_counter() - started, 3)}
+
+    async def _generate(self, query, retrieved, on_token):
+        """Answer from the cache or the LLM, as answer()'s result minus "seconds"."""
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.lookup, query, retrieved)
+            if cached is not None:
+                if on_token is not None:
+                    on_token(cached["answer"])
+                return {
+                    "answer": cached["answer"],
+                    "sources": [_source(doc) for doc in cached["documents"]],
+                    "cache": cached["match"],
+                }
+
+        documents = self.packer.run(documents=retrieved)["documents"]
+        prompt = self.prompt_builder.run(query=query, documents=documents)["prompt"]
+
+        callback = None
+        if on_token is not None:
+            loop = asyncio.get_running_loop()
+
+            def callback(chunk):
+                if chunk.content:
+                    loop.call_soon_threadsafe(on_token, chunk.content)
+
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, partial(self.llm.run, prompt=prompt, streaming_callback=callback)
+                )
+            finally:
+                self.in_flight -= 1
+        if self.cache is not None:
+            # Stored before the in-flight entry goes away, so a repeat finds it
+            await asyncio.to_thread(
+                self.cache.store, query, retrieved, result["replies"][0], documents
+            )
+        return {
+            "answer": result["replies"][0],
+            "sources": [_source(doc) for doc in documents],
+            "cache": "miss",
+        }
+
+    async def stream(self, query, top_k=None):
+        """Yield the reply as str chunks, then the answer() result dict."""
+        queue = asyncio.Queue()
+        task = asyncio.ensure_future(self.answer(query, top_k, on_token=queue.put_nowait))
+        # Tokens are queued before the task finishes, so None always comes last
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        while (token := await queue.get()) is not None:
+            yield token
+        yield await task
+
+
+service = QAService()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if service.pipeline is None:
+        service.load(os.getenv("QA_PDF_FOLDER", "./tech_blogs"))
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class AskRequest(BaseModel):
+    query: str
+    top_k: Optional[int] = None
+
+
+class Source(BaseModel):
+    file_path: str
+    score: Optional[float] = None
+
+
+class AskResponse(BaseModel):
+    answer: str
+    sources: List[Source]
+    seconds: float
+    # "exact" when answered from the answer cache, "coalesced"
+    # when it shared an identical request's answer that was in flight
+    cache: str = "miss"
+
+
+class BatchRequest(BaseModel):
+    queries: List[str]
+    top_k: Optional[int] = None
+
+
+class BatchResponse(BaseModel):
+    answers: List[AskResponse]
+    seconds: float
+
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(req: AskRequest):
+    return await service.answer(req.query, req.top_k)
+
+
+@app.post("/ask/batch", response_model=BatchResponse)
+async def ask_batch(req: BatchRequest):
+    # Submitted together, so the retrievals land in the same batch
+    started = time.perf_counter()
+    answers = await asyncio.gather(*(service.answer(query, req.top_k) for query in req.queries))
+    return BatchResponse(answers=answers, seconds=round(time.perf_counter() - started, 3))
+
+
+async def answer_events(query, top_k):
+    try:
+        async for item in service.stream(query, top_k):
+            if isinstance(item, dict):
+                yield sse_event("done", item)
+            else:
+                yield sse_event("token", {"text": item})
+    except Exception as exc:
+        yield sse_event("error", {"detail": f"{type(exc).__name__}: {exc}"})
+
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest):
+    return StreamingResponse(
+        answer_events(req.query, req.top_k),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream and holding back the first bytes
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/health")
+async def health():
+    batcher = service.batcher
+    return {
+        "documents": service.retriever.document_store.count_documents() if batcher else 0,
+        "answered": service.answered,
+        "in_flight": service.in_flight,
+        "coalesced": service.inflight.coalesced,
+        "answer_cache": service.cache.stats() if service.cache is not None else None,
+        "retrieval_batches": batcher.batches if batcher else 0,
+        "mean_batch_size": (
+            round(batcher.queries / batcher.batches, 2) if batcher and batcher.batches else 0
+        ),
+        "uptime_seconds": round(time.time() - service.started, 1),
+    }
+
+
+def _write(record):
+    sys.stdout.write(json.dumps(record) + "\n")
+    sys.stdout.flush()
+
+
+async def _answer_line(request_id, request, stream):
+    try:
+        if stream:
+            async for item in service.stream(request["query"], request.get("top_k")):
+                if isinstance(item, dict):
+                    _write({"id": request_id, **item})
+                else:
+                    _write({"id": request_id, "token": item})
+        else:
+            result = await service.answer(request["query"], request.get("top_k"))
+            _write({"id": request_id, **result})
+    except Exception as exc:
+        _write({"id": request_id, "error": f"{type(exc).__name__}: {exc}"})
+
+
+async def serve_stdin(stream=False):
+    """
+    Answer {"id": ..., "query": ..., "top_k": ...} lines from stdin, writing
+    one JSON line per answer to stdout as each finishes (so not necessarily in
+    input order). With stream=True, {"id": ..., "token": ...} lines come first.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    line_number = 0
+    while line := await loop.run_in_executor(None, sys.stdin.readline):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if isinstance(request, str):
+                request = {"query": request}
+            request_id = request.get("id", line_number)
+        except (ValueError, AttributeError) as exc:
+            _write({"id": line_number, "error": f"Bad request line: {exc}"})
+            continue
+        task = asyncio.ensure_future(_answer_line(request_id, request, stream))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve questions over the tech blog PDFs.")
+    parser.add_argument("--folder", default="./tech_blogs")
+    parser.add_argument("--stdin", action="store_true", help="read JSON lines from stdin")
+    parser.add_argument("--stream", action="store_true", help="with --stdin, also emit tokens")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    if args.stdin:
+        # stdout carries the answers, so progress output goes to stderr
+        with redirect_stdout(sys.stderr):
+            service.load(args.folder)
+        asyncio.run(serve_stdin(stream=args.stream))
+    else:
+        import uvicorn
+
+        service.load(args.folder)
+        uvicorn.run(app, host=args.host, port=args.port)
+
+
+# Ingestion starts worker processes that re-import this module
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Single-flight request coalescing.
+Concurrent callers asking for the same key share one in-flight call instead
+of each starting their own.
+"""
+
+import asyncio
+import copy
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    async def do(self, key, fn):
+        """
+        Run `fn()` for `key`, or join the call already running for it.
+        Every caller gets its own deep copy of the result, so nobody can
+        mutate what another caller sees. Exceptions propagate to all callers.
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            self.calls += 1
+            # A task (rather than awaiting fn() here) keeps the call alive if
+            # the caller that started it is cancelled.
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        result = await asyncio.shield(future)
+        return copy.deepcopy(result)
@@ -0,0 +1,161 @@
+"""
+Streaming PDF conversion and splitting with bounded memory.
+PyPDFToDocument reads the whole file, extracts every page and joins them
+into one Document before DocumentSplitter sees any of it, so memory grows
+with the PDF and nothing is searchable until the file is done. Here pages
+are extracted one at a time from the open file and fed straight into a word
+splitter that only holds one window of words. Chunks come out as soon as
+they are complete and can be written to a document store in batches.
+
+The chunks match DocumentSplitter(split_by="word") on the "\\f"-joined page
+text: same content, page_number, split_id, split_idx_start and
+_split_overlap. The exception is source_id, which is the PDF's sha256, since
+the id of the full-text Document isn't known until the last page is read.
+
+ingest.py uses this for its worker processes and for `--stream`. Only a
+store that indexes writes incrementally (InMemoryDocumentStore) makes the
+early batches searchable; MmapBM25DocumentStore rebuilds on every write.
+"""
+
+import os
+import time
+from collections import deque
+
+from haystack import Document
+from pypdf import PdfReader
+
+
+def iter_pages(path):
+    """Yield one Document per page of `path`, reading pages lazily."""
+    with open(path, "rb") as f:
+        reader = PdfReader(f)
+        for number, page in enumerate(reader.pages, start=1):
+            text = page.extract_text()
+            # pypdf keeps every object it has resolved; without this the
+            # cache grows with the page count
+            reader.resolved_objects.clear()
+            yield Document(
+                content=text, meta={"file_path": os.path.basename(path), "page_number": number}
+            )
+
+
+class StreamingWordSplitter:
+    """
+    DocumentSplitter(split_by="word") over a stream of page Documents.
+    Words are split on single spaces exactly like DocumentSplitter, with pages
+    joined by "\\f", so a word can straddle a page break. Each chunk is held
+    back until the next one exists, because its _split_overlap also names
+    the chunk after it.
+    """
+
+    def __init__(self, split_by="word", split_length=200, split_overlap=0):
+        if split_by != "word":
+            raise ValueError(f"StreamingWordSplitter only splits by word, not {split_by!r}")
+        if split_overlap >= split_length:
+            raise ValueError("split_overlap must be smaller than split_length")
+        self.split_length = split_length
+        self.split_overlap = split_overlap
+
+    def _units(self, pages):
+        """Words with their trailing space, as DocumentSplitter makes them."""
+        pending = ""
+        for i, page in enumerate(pages):
+            text = page.content or ""
+            parts = (pending + ("\f" if i else "") + text).split(" ")
+            pending = parts.pop()
+            for part in parts:
+                yield part + " "
+        yield pending
+
+    def _windows(self, units):
+        """more_itertools.windowed(units, n, step), minus the None padding."""
+        n = self.split_length
+        step = n - self.split_overlap
+        window = deque(maxlen=n)
+        countdown = n
+        for unit in units:
+            window.append(unit)
+            countdown -= 1
+            if not countdown:
+                countdown = step
+                yield list(window)
+        if window and len(window) < n:
+            yield list(window)
+        elif 0 < countdown < min(step, n):
+            # The tail past the last full window
+            yield list(window)[countdown:]
+
+    def split(self, pages, meta):
+        """
+        Yield chunk Documents for the page Documents in `pages`. `meta` is
+        copied into every chunk and must include "source_id".
+        """
+        step = self.split_length - self.split_overlap
+        start = 0
+        page_number = 1
+        split_id = 0
+        previous = None
+        for units in self._windows(self._units(pages)):
+            text = "".join(units)
+            if text:
+                chunk = Document(
+                    content=text,
+                    meta={
+                        **meta,
+                        "page_number": page_number,
+                        "split_id": split_id,
+                        "split_idx_start": start,
+                    },
+                )
+                if self.split_overlap > 0:
+                    chunk.meta["_split_overlap"] = []
+                    if previous is not None:
+                        _link_overlap(previous, chunk)
+                if previous is not None:
+                    yield previous
+                previous = chunk
+                split_id += 1
+            processed = "".join(units[:step])
+            start += len(processed)
+            page_number += processed.count("\f")
+        if previous is not None:
+            yield previous
+
+
+def _link_overlap(previous, current):
+    """Record the shared text in both chunks' _split_overlap, like DocumentSplitter."""
+    offset = current.meta["split_idx_start"] - previous.meta["split_idx_start"]
+    end = len(previous.content)
+    if offset < end and current.content.startswith(previous.content[offset:end]):
+        current.meta["_split_overlap"].append({"doc_id": previous.id, "range": (offset, end)})
+        previous.meta["_split_overlap"].append({"doc_id": current.id, "range": (0, end - offset)})
+
+
+def iter_chunks(path, source_id, split=None):
+    """Yield the chunks of one PDF as its pages are read."""
+    meta = {"file_path": os.path.basename(path), "source_id": source_id}
+    return StreamingWordSplitter(**(split or {})).split(iter_pages(path), meta)
+
+
+def write_in_batches(chunks, document_store, batch_size=256):
+    """
+    Write `chunks` to `document_store` every `batch_size` documents, so the
+    first ones are searchable while the rest are still being extracted.
+    Returns (chunks written, seconds until the first batch landed).
+    """
+    started = time.perf_counter()
+    first_batch = None
+    written = 0
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            written += document_store.write_documents(batch)
+            batch = []
+            if first_batch is None:
+                first_batch = time.perf_counter() - started
+    if batch:
+        written += document_store.write_documents(batch)
+        if first_batch is None:
+            first_batch = time.perf_counter() - started
+    return written, first_batch
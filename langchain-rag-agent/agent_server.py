@@ -0,0 +1,285 @@
+"""
+Long-running weather agent service.
+The FAISS index, forecast table, embeddings and LLM clients are loaded once at
+startup and shared read-only by every session. When an ingest rewrites the
+index on disk, it is loaded again and swapped in. Each session gets its own
+chain and summarizing memory, created on first use and dropped after sitting
+idle.
+
+    uvicorn agent_server:app --port 8000
+
+    curl -X POST localhost:8000/ask -H 'Content-Type: application/json' \\
+        -d '{"session_id": "alice", "question": "Will it rain in London tomorrow?"}'
+    curl -N -X POST localhost:8000/ask/stream -H 'Content-Type: application/json' \\
+        -d '{"session_id": "alice", "question": "And the day after?"}'
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from langchain_openai import OpenAI, OpenAIEmbeddings
+from pydantic import BaseModel
+
+from cached_embeddings import CachedEmbeddings
+from forecast_filter import FilteredForecastRetriever
+from forecast_table import ANSWER_TAG, TABLE_FILE, ForecastTable
+from rag_agent import FAISS_INDEX_DIR, build_agent, load_faiss_index
+from summary_memory import SessionMemoryStore
+
+SESSION_IDLE_SECONDS = float(os.getenv("AGENT_SESSION_IDLE_SECONDS", "1800"))
+SESSION_SWEEP_SECONDS = float(os.getenv("AGENT_SESSION_SWEEP_SECONDS", "60"))
+MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", "1000"))
+MEMORY_TURNS = int(os.getenv("AGENT_MEMORY_TURNS", "4"))
+MEMORY_TOKENS = int(os.getenv("AGENT_MEMORY_TOKENS", "1000"))
+# How often to check whether an ingest has rewritten the index on disk
+INDEX_CHECK_SECONDS = float(os.getenv("AGENT_INDEX_CHECK_SECONDS", "30"))
+# Files an ingest writes; a change to any of them triggers a reload
+INDEX_FILES = ("index.faiss", "index.pkl", TABLE_FILE)
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class AgentService:
+    """Shared, read-only resources plus the live sessions built on them."""
+
+    def __init__(self):
+        self.index_dir = None
+        self.index_version = None
+        self.embeddings = None
+        self.vectordb = None
+        self.table = None
+        self.llm = None
+        self.question_llm = None
+        self.retriever = None
+        self.memories = None
+        self.agents = {}
+        self.locks = {}
+        self.started = time.time()
+
+    def load(self, index_dir=FAISS_INDEX_DIR):
+        self.index_dir = index_dir
+        self.embeddings = CachedEmbeddings(OpenAIEmbeddings())
+        self.index_version = self.disk_version()
+        self.vectordb = load_faiss_index(self.embeddings, index_dir)
+        if self.vectordb is None:
+            raise RuntimeError(
+                f"No FAISS index in {index_dir}; run rag_agent.py or forecast_ingest.py first"
+            )
+        self.table = ForecastTable.load(index_dir)
+        # Only the answering LLM streams; rephrasing follow-ups and summarizing
+        # memory happen in the background of a turn
+        self.setup(
+            llm=OpenAI(temperature=0, streaming=True, tags=[ANSWER_TAG]),
+            question_llm=OpenAI(temperature=0),
+        )
+
+    def setup(self, llm, question_llm):
+        self.llm = llm
+        self.question_llm = question_llm
+        self.retriever = FilteredForecastRetriever(vectordb=self.vectordb)
+        self.memories = SessionMemoryStore(
+            question_llm, k=MEMORY_TURNS, max_token_limit=MEMORY_TOKENS
+        )
+
+    def disk_version(self):
+        """Modification times of the index files, to notice a new ingest."""
+        version = []
+        for name in INDEX_FILES:
+            try:
+                version.append(os.stat(os.path.join(self.index_dir, name)).st_mtime_ns)
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+    def _load_changed(self):
+        """(version, vectordb, table, retriever) if an ingest rewrote the index, else None."""
+        version = self.disk_version()
+        if self.index_dir is None or version == self.index_version:
+            return None
+        try:
+            vectordb = load_faiss_index(self.embeddings, self.index_dir)
+            table = ForecastTable.load(self.index_dir)
+        except Exception:
+            # Most likely caught mid-write; the next check tries again
+            return None
+        # Changed again while loading, so what we read may be a mix of two ingests
+        if vectordb is None or version != self.disk_version():
+            return None
+        return version, vectordb, table, FilteredForecastRetriever(vectordb=vectordb)
+
+    async def reload_if_changed(self):
+        """
+        Load the index and table again if an ingest has rewritten them. The
+        loading runs on a worker thread and the swap on the event loop, so
+        requests see either the old index or the new one. Returns True if a
+        new index was swapped in.
+        """
+        loaded = await asyncio.to_thread(self._load_changed)
+        if loaded is None:
+            return False
+        self.index_version, self.vectordb, self.table, self.retriever = loaded
+        # Chains hold the old index; the next turn of each session rebuilds its
+        # chain around the same memory. Turns already running finish on the old one
+        self.agents.clear()
+        return True
+
+    def session(self, session_id):
+        """(agent, lock) for a session, building the agent on first use."""
+        memory = self.memories.get(session_id)
+        agent = self.agents.get(session_id)
+        if agent is None:
+            if len(self.agents) >= MAX_SESSIONS:
+                self._drop_least_recent()
+            agent = build_agent(
+                self.vectordb,
+                self.table,
+                memory=memory,
+                llm=self.llm,
+                question_llm=self.question_llm,
+                retriever=self.retriever,
+            )
+            self.agents[session_id] = agent
+        # Turns within one session run in order so memory stays consistent.
+        # The lock outlives a rebuilt chain, so a reload can't let two turns overlap
+        lock = self.locks.setdefault(session_id, asyncio.Lock())
+        return agent, lock
+
+    def drop(self, session_id):
+        self.memories.drop(session_id)
+        self.locks.pop(session_id, None)
+        return self.agents.pop(session_id, None) is not None
+
+    def _drop_least_recent(self):
+        last_used = self.memories.last_used
+        oldest = min(self.agents, key=lambda sid: last_used.get(sid, 0))
+        self.drop(oldest)
+
+    def evict_idle(self, max_idle=SESSION_IDLE_SECONDS):
+        cutoff = time.monotonic() - max_idle
+        idle = []
+        for session_id, used in list(self.memories.last_used.items()):
+            lock = self.locks.get(session_id)
+            # Leave a session alone while it's mid-answer
+            if used < cutoff and not (lock is not None and lock.locked()):
+                idle.append(session_id)
+        for session_id in idle:
+            self.drop(session_id)
+        return idle
+
+
+service = AgentService()
+
+
+async def _sweep_idle_sessions():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_SECONDS)
+        service.evict_idle()
+
+
+async def _watch_index():
+    while True:
+        await asyncio.sleep(INDEX_CHECK_SECONDS)
+        await service.reload_if_changed()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if service.vectordb is None:
+        service.load()
+    tasks = [
+        asyncio.create_task(_sweep_idle_sessions()),
+        asyncio.create_task(_watch_index()),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class AskRequest(BaseModel):
+    question: str
+    # Omit to start a new session; the response says which one was used
+    session_id: Optional[str] = None
+
+
+class AskResponse(BaseModel):
+    session_id: str
+    answer: str
+    route: str
+    seconds: float
+
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(req: AskRequest):
+    session_id = req.session_id or uuid.uuid4().hex
+    agent, lock = service.session(session_id)
+    started = time.perf_counter()
+    async with lock:
+        result = await agent.ainvoke({"question": req.question})
+    return AskResponse(
+        session_id=session_id,
+        answer=result["answer"].strip(),
+        route=result.get("route", "retrieval"),
+        seconds=round(time.perf_counter() - started, 3),
+    )
+
+
+async def answer_events(agent, lock, session_id, question):
+    started = time.perf_counter()
+    yield sse_event("session", {"session_id": session_id})
+    async with lock:
+        try:
+            async for item in agent.astream({"question": question}):
+                if isinstance(item, dict):
+                    yield sse_event(
+                        "done",
+                        {
+                            "answer": item["answer"].strip(),
+                            "route": item["route"],
+                            "seconds": round(time.perf_counter() - started, 3),
+                        },
+                    )
+                elif item:
+                    yield sse_event("token", {"text": item})
+        except Exception as exc:
+            yield sse_event("error", {"detail": f"{type(exc).__name__}: {exc}"})
+
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest):
+    session_id = req.session_id or uuid.uuid4().hex
+    agent, lock = service.session(session_id)
+    return StreamingResponse(
+        answer_events(agent, lock, session_id, req.question),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream and holding back the first bytes
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.delete("/sessions/{session_id}")
+async def end_session(session_id: str):
+    if not service.drop(session_id):
+        raise HTTPException(status_code=404, detail="Unknown session.")
+    return {"session_id": session_id, "ended": True}
+
+
+@app.get("/health")
+async def health():
+    return {
+        "sessions": len(service.agents),
+        "indexed_forecasts": service.vectordb.index.ntotal if service.vectordb else 0,
+        "table_rows": len(service.table) if service.table is not None else 0,
+        "uptime_seconds": round(time.time() - service.started, 1),
+    }
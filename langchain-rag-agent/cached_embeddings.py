@@ -0,0 +1,152 @@
+"""
+Caching wrapper for LangChain embeddings.
+Vectors are keyed on a hash of (model name, text), kept in LRU order with a
+size cap, and saved as one flat float32 file that is memory-mapped on load,
+so repeat runs make close to zero embedding calls and start without parsing
+anything but a small JSON index.
+
+Saving rewrites the whole file, so it happens when save() is called (once
+after a bulk load, say) rather than after every call. Queries aren't cached:
+each question is usually new, and caching them would push document vectors
+out of the LRU.
+
+    embeddings = CachedEmbeddings(OpenAIEmbeddings())
+    FAISS.from_documents(docs, embeddings)
+    embeddings.save()
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./embedding_cache")
+
+
+def _model_name(embeddings):
+    for attr in ("model", "model_name", "deployment"):
+        name = getattr(embeddings, attr, None)
+        if isinstance(name, str) and name:
+            return name
+    return type(embeddings).__name__
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(
+        self,
+        underlying,
+        cache_dir=DEFAULT_CACHE_DIR,
+        max_entries=100_000,
+        autosave=False,
+    ):
+        self.underlying = underlying
+        self.model = _model_name(underlying)
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.autosave = autosave
+        self.hits = 0
+        self.misses = 0
+        self.dim = None
+        # key -> row in the memory-mapped file (int) or a freshly embedded vector
+        self._entries = OrderedDict()
+        self._vectors = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.cache_dir, f"{self._slug}.json")
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.cache_dir, f"{self._slug}.f32")
+
+    @property
+    def _slug(self):
+        # One file pair per model, so switching models never mixes vectors
+        return hashlib.sha256(self.model.encode("utf-8")).hexdigest()[:16]
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path) as f:
+            index = json.load(f)
+        self.dim = index["dim"]
+        keys = index["keys"]  # least recently used first
+        if keys:
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(len(keys), self.dim)
+            )
+        self._entries = OrderedDict((key, row) for row, key in enumerate(keys))
+
+    def _vector(self, entry):
+        return self._vectors[entry] if isinstance(entry, int) else entry
+
+    def save(self):
+        """Write the cache out, compacted to the live entries in LRU order."""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            keys = list(self._entries)
+            matrix = np.empty((len(keys), self.dim or 0), dtype=np.float32)
+            for row, key in enumerate(keys):
+                matrix[row] = self._vector(self._entries[key])
+            # Write beside the old files and swap, so a crash never leaves a
+            # half-written cache behind
+            matrix.tofile(self._vectors_path + ".tmp")
+            with open(self._index_path + ".tmp", "w") as f:
+                json.dump({"model": self.model, "dim": self.dim, "keys": keys}, f)
+            self._vectors = None
+            os.replace(self._vectors_path + ".tmp", self._vectors_path)
+            os.replace(self._index_path + ".tmp", self._index_path)
+            if keys:
+                self._vectors = np.memmap(
+                    self._vectors_path, dtype=np.float32, mode="r", shape=matrix.shape
+                )
+            self._entries = OrderedDict((key, row) for row, key in enumerate(keys))
+            self._dirty = False
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        found = {}
+        missing = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = self._vector(entry)
+                    self.hits += 1
+                else:
+                    missing[key] = text
+                    self.misses += 1
+
+        if missing:
+            # One bulk call for every miss in the batch
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            with self._lock:
+                for key, vector in zip(missing, vectors):
+                    vector = np.asarray(vector, dtype=np.float32)
+                    self.dim = self.dim or vector.shape[0]
+                    self._entries[key] = found[key] = vector
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._dirty = True
+            if self.autosave:
+                self.save()
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        return self.underlying.embed_query(text)
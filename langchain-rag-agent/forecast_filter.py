@@ -0,0 +1,197 @@
+"""
+Metadata pre-filtering for forecast retrieval.
+A small parser pulls city and date constraints out of a question ("rain in
+London next Tuesday"), an inverted index on city and time narrows the FAISS
+positions to the matching forecast slots, and only those vectors are scored.
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, List, Optional
+
+import faiss
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DAY = timedelta(days=1)
+
+
+@dataclass
+class QueryConstraints:
+    cities: Optional[List[str]] = None  # lower-cased
+    start: Optional[int] = None  # unix seconds, inclusive
+    end: Optional[int] = None  # unix seconds, exclusive
+
+    @property
+    def empty(self):
+        return self.cities is None and self.start is None and self.end is None
+
+
+def _day_range(day, days=1):
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return int(start.timestamp()), int((start + days * DAY).timestamp())
+
+
+def parse_date_range(question, now=None):
+    """Return (start, end) unix seconds for the first date phrase found, or (None, None)."""
+    now = now or datetime.now(timezone.utc)
+    today = now.date()
+    text = question.lower()
+
+    match = re.search(r"\b(\d{4})-(\d{2})-(\d{2})\b", text)
+    if match:
+        try:
+            return _day_range(datetime(*map(int, match.groups())))
+        except (ValueError, OverflowError):
+            # "2026-02-30" isn't a date, and 9999-12-31 has no next day; treat the question as undated
+            return None, None
+    if "day after tomorrow" in text:
+        return _day_range(today + 2 * DAY)
+    if re.search(r"\btomorrow\b", text):
+        return _day_range(today + DAY)
+    if re.search(r"\b(today|tonight)\b", text):
+        return _day_range(today)
+    match = re.search(r"\bin (\d+) days?\b", text)
+    if match:
+        try:
+            return _day_range(today + int(match.group(1)) * DAY)
+        except (ValueError, OverflowError):
+            # "in 99999999 days" runs past datetime's range
+            return None, None
+    match = re.search(r"\b(?:(next|this|on) )?(" + "|".join(WEEKDAYS) + r")\b", text)
+    if match:
+        # Forecasts only cover five days, so "Tuesday" and "next Tuesday" both
+        # mean the coming one; "next" rules out today
+        ahead = (WEEKDAYS.index(match.group(2)) - today.weekday()) % 7
+        if ahead == 0 and match.group(1) == "next":
+            ahead = 7
+        return _day_range(today + ahead * DAY)
+    if re.search(r"\b(this )?weekend\b", text):
+        return _day_range(today + ((5 - today.weekday()) % 7) * DAY, days=2)
+    if re.search(r"\bnext week\b", text):
+        return _day_range(today + (7 - today.weekday()) * DAY, days=7)
+    if re.search(r"\bthis week\b", text):
+        return _day_range(today, days=7 - today.weekday())
+    return None, None
+
+
+@lru_cache(maxsize=8)
+def _city_pattern(cities):
+    # Longest first, so "New York City" wins over "York"
+    names = sorted({city.lower() for city in cities}, key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(map(re.escape, names)) + r")\b")
+
+
+def parse_query_constraints(question, known_cities, now=None):
+    text = question.lower()
+    cities = None
+    if known_cities:
+        found = _city_pattern(tuple(known_cities)).findall(text)
+        cities = list(dict.fromkeys(found))
+    start, end = parse_date_range(question, now)
+    return QueryConstraints(cities=cities or None, start=start, end=end)
+
+
+def _doc_timestamp(doc):
+    if "dt" in doc.metadata:
+        return int(doc.metadata["dt"])
+    # Documents stored before "dt" was added only have the formatted date
+    parsed = datetime.strptime(doc.metadata["date"], "%Y-%m-%d %H:%M")
+    return int(parsed.replace(tzinfo=timezone.utc).timestamp())
+
+
+class ForecastMetadataIndex:
+    """
+    city -> FAISS positions sorted by forecast time, so a city + date range
+    lookup is a dict access and two binary searches.
+    """
+
+    def __init__(self, vectordb):
+        self.vectordb = vectordb
+        self.refresh()
+
+    def _version(self):
+        # FAISS.delete() renumbers positions and swaps the mapping dict out
+        return id(self.vectordb.index_to_docstore_id), self.vectordb.index.ntotal
+
+    def refresh(self):
+        by_city = {}
+        self.city_names = {}
+        for position, doc_id in self.vectordb.index_to_docstore_id.items():
+            doc = self.vectordb.docstore.search(doc_id)
+            city = doc.metadata.get("city", "")
+            self.city_names[city.lower()] = city
+            by_city.setdefault(city.lower(), []).append((_doc_timestamp(doc), position))
+        self.cities = {}
+        for city, entries in by_city.items():
+            entries.sort()
+            self.cities[city] = (
+                np.array([dt for dt, _ in entries], dtype=np.int64),
+                np.array([position for _, position in entries], dtype=np.int64),
+            )
+        self.version = self._version()
+
+    def _ensure_fresh(self):
+        if self.version != self._version():
+            self.refresh()
+
+    def known_cities(self):
+        self._ensure_fresh()
+        return list(self.city_names.values())
+
+    def candidates(self, constraints):
+        """FAISS positions matching the constraints, or None when there are none."""
+        self._ensure_fresh()
+        if constraints.empty:
+            return None
+        cities = constraints.cities if constraints.cities else list(self.cities)
+        selected = []
+        for city in cities:
+            if city not in self.cities:
+                continue
+            dts, positions = self.cities[city]
+            lo = 0 if constraints.start is None else np.searchsorted(dts, constraints.start)
+            hi = len(dts) if constraints.end is None else np.searchsorted(dts, constraints.end)
+            selected.append(positions[lo:hi])
+        return np.concatenate(selected) if selected else np.empty(0, dtype=np.int64)
+
+
+class FilteredForecastRetriever(BaseRetriever):
+    """
+    Drop-in replacement for vectordb.as_retriever(): questions that mention a
+    city or a date are only matched against forecasts for that city and date.
+    """
+
+    vectordb: Any
+    index: Any = None
+    k: int = 4
+
+    def model_post_init(self, __context):
+        if self.index is None:
+            self.index = ForecastMetadataIndex(self.vectordb)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        constraints = parse_query_constraints(query, self.index.known_cities())
+        candidates = self.index.candidates(constraints)
+        if candidates is None:
+            return self.vectordb.similarity_search(query, k=self.k)
+        if len(candidates) == 0:
+            return []
+
+        vector = np.array([self.vectordb.embeddings.embed_query(query)], dtype=np.float32)
+        if getattr(self.vectordb, "_normalize_L2", False):
+            faiss.normalize_L2(vector)
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(candidates))
+        k = min(self.k, len(candidates))
+        _, positions = self.vectordb.index.search(vector, k, params=params)
+
+        docs = []
+        for position in positions[0]:
+            if position == -1:
+                continue
+            doc_id = self.vectordb.index_to_docstore_id[int(position)]
+            docs.append(self.vectordb.docstore.search(doc_id))
+        return docs
@@ -0,0 +1,204 @@
+"""
+Concurrent forecast ingestion for many cities.
+Fetches OpenWeatherMap forecasts over one pooled keep-alive HTTP client with
+bounded concurrency, sends conditional requests (If-None-Match /
+If-Modified-Since) so unchanged cities cost a 304, and writes each city into
+the FAISS store as soon as its response arrives.
+
+    python forecast_ingest.py London Paris Tokyo
+    python forecast_ingest.py --cities-file cities.txt --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+from langchain_openai import OpenAIEmbeddings
+
+from cached_embeddings import CachedEmbeddings
+from forecast_table import ForecastTable
+from rag_agent import (
+    FAISS_INDEX_DIR,
+    OPENWEATHER_API_KEY,
+    OPENWEATHER_BASE_URL,
+    evict_expired_forecasts,
+    load_faiss_index,
+    store_forecasts_in_faiss,
+)
+
+VALIDATORS_FILE = "validators.json"
+
+
+class ConditionalRequestCache:
+    """ETag / Last-Modified per city, saved next to the index."""
+
+    def __init__(self, path):
+        self.path = path
+        self.validators = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.validators = json.load(f)
+
+    def headers(self, city):
+        saved = self.validators.get(city.lower(), {})
+        headers = {}
+        if saved.get("etag"):
+            headers["If-None-Match"] = saved["etag"]
+        if saved.get("last_modified"):
+            headers["If-Modified-Since"] = saved["last_modified"]
+        return headers
+
+    def update(self, city, response):
+        self.validators[city.lower()] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+    def clear(self):
+        self.validators = {}
+
+    def forget(self, city):
+        self.validators.pop(city.lower(), None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.validators, f)
+
+
+async def fetch_city_forecast(client, city, api_key, validators):
+    """Returns the forecast list, or None when the server says it's unchanged."""
+    response = await client.get(
+        "/forecast",
+        params={"q": city, "units": "metric", "appid": api_key},
+        headers=validators.headers(city),
+    )
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+    validators.update(city, response)
+    return response.json()["list"]
+
+
+async def ingest_cities(
+    cities,
+    api_key=OPENWEATHER_API_KEY,
+    vectordb=None,
+    embeddings=None,
+    index_dir=FAISS_INDEX_DIR,
+    base_url=OPENWEATHER_BASE_URL,
+    concurrency=20,
+    timeout=10.0,
+):
+    """
+    Fetch every city concurrently and upsert each into the vector store (and
+    the numeric forecast table) as it arrives. Returns (vectordb, stats).
+    """
+    # Saved once at the end rather than after every city
+    embeddings = embeddings or CachedEmbeddings(OpenAIEmbeddings(), autosave=False)
+    if vectordb is None:
+        vectordb = load_faiss_index(embeddings, index_dir)
+    # Without an index there's nothing the 304s could refer to
+    validators = ConditionalRequestCache(os.path.join(index_dir, VALIDATORS_FILE))
+    if vectordb is None:
+        validators.clear()
+    table = ForecastTable.load(index_dir)
+
+    stats = {"fetched": 0, "not_modified": 0, "failed": 0, "errors": {}}
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        limits=httpx.Limits(
+            max_connections=concurrency, max_keepalive_connections=concurrency
+        ),
+        timeout=httpx.Timeout(timeout, connect=5.0),
+    ) as client:
+
+        async def fetch(city):
+            async with semaphore:
+                try:
+                    return city, await fetch_city_forecast(
+                        client, city, api_key, validators
+                    ), None
+                except (httpx.HTTPError, KeyError, ValueError) as exc:
+                    return city, None, exc
+
+        tasks = [asyncio.create_task(fetch(city)) for city in cities]
+        for next_done in asyncio.as_completed(tasks):
+            city, forecasts, error = await next_done
+            if error is not None:
+                stats["failed"] += 1
+                stats["errors"][city] = f"{type(error).__name__}: {error}"
+                validators.forget(city)
+                continue
+            if forecasts is None:
+                stats["not_modified"] += 1
+                continue
+            # FAISS isn't thread-safe, so writes happen one city at a time here
+            # while the remaining fetches carry on
+            try:
+                vectordb = await asyncio.to_thread(
+                    store_forecasts_in_faiss,
+                    forecasts,
+                    city,
+                    vectordb,
+                    embeddings,
+                    index_dir,
+                    False,
+                    table,
+                )
+            except Exception as exc:
+                # e.g. the embedding call failed; the other cities still get stored
+                stats["failed"] += 1
+                stats["errors"][city] = f"{type(exc).__name__}: {exc}"
+                validators.forget(city)
+                continue
+            stats["fetched"] += 1
+
+    # Slots expire whether or not their city changed, so a run where every
+    # city answered 304 still prunes them
+    stats["evicted"] = await asyncio.to_thread(evict_expired_forecasts, vectordb, table)
+    if vectordb is not None:
+        vectordb.save_local(index_dir)
+        table.save(index_dir)
+        validators.save()
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings.save()
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return vectordb, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest forecasts for many cities.")
+    parser.add_argument("cities", nargs="*")
+    parser.add_argument("--cities-file", help="one city per line")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--index-dir", default=FAISS_INDEX_DIR)
+    parser.add_argument("--base-url", default=OPENWEATHER_BASE_URL)
+    args = parser.parse_args()
+
+    cities = list(args.cities)
+    if args.cities_file:
+        with open(args.cities_file) as f:
+            cities.extend(line.strip() for line in f if line.strip())
+    if not cities:
+        parser.error("give at least one city")
+
+    _, stats = asyncio.run(
+        ingest_cities(
+            cities,
+            index_dir=args.index_dir,
+            base_url=args.base_url,
+            concurrency=args.concurrency,
+        )
+    )
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+Columnar forecast table and a numeric fast path for the agent.
+The raw forecast numbers are kept in NumPy columns next to the FAISS index.
+Trend, min/max/mean and chance-of-rain questions are computed from them
+directly, and the LLM is only asked to put the result into words instead of
+reading numbers out of retrieved snippets.
+"""
+
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from forecast_filter import parse_query_constraints
+
+TABLE_FILE = "forecast_table.npz"
+COLUMNS = ["dt", "temp", "temp_min", "temp_max", "humidity", "pop"]
+RAIN_THRESHOLD = 0.5  # probability of precipitation counted as "likely"
+# Tag on the LLM that writes answers, so streaming can skip the other LLM calls
+ANSWER_TAG = "answer"
+# Cities reported when neither the question nor the conversation names one,
+# so the prompt stays small however many cities the table holds
+MAX_UNNAMED_CITIES = 5
+
+# Checked in order; trend words come before min/max so "warmer" isn't "warmest"
+INTENTS = [
+    ("trend", r"\b(trend|warmer|colder|cooler|warming|cooling|getting (hotter|warmer|colder|cooler))\b"),
+    ("rain", r"\b(rain|raining|rainy|precipitation|umbrella|showers?|wet)\b"),
+    ("max", r"\b(hottest|warmest|highest|max(imum)?|peak)\b"),
+    ("min", r"\b(coldest|coolest|lowest|min(imum)?)\b"),
+    ("mean", r"\b(average|mean|typical)\b"),
+]
+
+
+def classify_question(question):
+    text = question.lower()
+    for intent, pattern in INTENTS:
+        if re.search(pattern, text):
+            return intent
+    return None
+
+
+def _format_time(dt):
+    return datetime.fromtimestamp(int(dt), tz=timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+class ForecastTable:
+    """One row per (city, 3-hour slot); every column is a NumPy array."""
+
+    def __init__(self):
+        self.city = np.empty(0, dtype=str)
+        self.columns = {name: np.empty(0) for name in COLUMNS}
+        self.columns["dt"] = self.columns["dt"].astype(np.int64)
+        self._keys = self.city
+        self._cities = []
+
+    def __len__(self):
+        return len(self.city)
+
+    def _set(self, city, columns):
+        order = np.lexsort((columns["dt"], np.char.lower(city)))
+        self.city = city[order]
+        self.columns = {name: values[order] for name, values in columns.items()}
+        self._keys = np.char.lower(self.city)
+        self._cities = list(dict.fromkeys(self.city.tolist()))
+
+    def upsert(self, city, forecasts, cutoff=None):
+        """Replace `city`'s rows with `forecasts` and drop slots older than `cutoff`."""
+        keep = self._keys != city.lower()
+        if cutoff is not None:
+            keep &= self.columns["dt"] >= cutoff
+            forecasts = [f for f in forecasts if f["dt"] >= cutoff]
+        new = {
+            "dt": np.array([f["dt"] for f in forecasts], dtype=np.int64),
+            "temp": np.array([f["main"]["temp"] for f in forecasts], dtype=float),
+            "temp_min": np.array([f["main"]["temp_min"] for f in forecasts], dtype=float),
+            "temp_max": np.array([f["main"]["temp_max"] for f in forecasts], dtype=float),
+            "humidity": np.array([f["main"]["humidity"] for f in forecasts], dtype=float),
+            "pop": np.array([f.get("pop", 0.0) for f in forecasts], dtype=float),
+        }
+        self._set(
+            np.concatenate([self.city[keep], np.full(len(forecasts), city)]),
+            {
+                name: np.concatenate([values[keep], new[name]])
+                for name, values in self.columns.items()
+            },
+        )
+
+    def evict(self, cutoff):
+        """Drop every row older than `cutoff`; returns how many were dropped."""
+        keep = self.columns["dt"] >= cutoff
+        dropped = int(len(keep) - keep.sum())
+        if dropped:
+            self._set(
+                self.city[keep],
+                {name: values[keep] for name, values in self.columns.items()},
+            )
+        return dropped
+
+    def cities(self):
+        return self._cities
+
+    def select(self, city, start=None, end=None):
+        """
+        Slice of rows for one city (any case) within [start, end). Rows are
+        sorted by (city, dt), so this is a handful of binary searches.
+        """
+        key = city.lower()
+        lo = np.searchsorted(self._keys, key, side="left")
+        hi = np.searchsorted(self._keys, key, side="right")
+        dt = self.columns["dt"][lo:hi]
+        if start is not None:
+            lo, hi = lo + np.searchsorted(dt, start), hi
+            dt = self.columns["dt"][lo:hi]
+        if end is not None:
+            hi = lo + np.searchsorted(dt, end)
+        return slice(int(lo), int(hi))
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        path = os.path.join(index_dir, TABLE_FILE)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, city=self.city, **self.columns)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, index_dir):
+        """Load the saved table, or return an empty one on the first run."""
+        table = cls()
+        path = os.path.join(index_dir, TABLE_FILE)
+        if os.path.exists(path):
+            with np.load(path) as data:
+                table._set(data["city"], {name: data[name] for name in COLUMNS})
+        return table
+
+
+def compute_facts(table, intent, mask):
+    """Numbers answering `intent` over one city's rows (a slice from select())."""
+    dt = table.columns["dt"][mask]
+    temp = table.columns["temp"][mask]
+    facts = {
+        "from": _format_time(dt[0]),
+        "to": _format_time(dt[-1]),
+        "slots": int(len(dt)),
+    }
+    if intent == "trend":
+        # Least-squares slope of temperature over time, in °C per day
+        days = (dt - dt[0]) / 86400.0
+        spread = days - days.mean()
+        denominator = float((spread**2).sum())
+        slope = float((spread * (temp - temp.mean())).sum()) / denominator if denominator else 0.0
+        first_day = temp[days < 1].mean()
+        last_day = temp[days > days[-1] - 1].mean()
+        facts.update(
+            {
+                "trend_c_per_day": round(slope, 2),
+                "direction": "warmer" if slope > 0.3 else "colder" if slope < -0.3 else "steady",
+                "first_24h_mean_c": round(float(first_day), 1),
+                "last_24h_mean_c": round(float(last_day), 1),
+            }
+        )
+    elif intent == "rain":
+        pop = table.columns["pop"][mask]
+        likely = pop >= RAIN_THRESHOLD
+        peak = int(np.argmax(pop))
+        facts.update(
+            {
+                "max_chance_of_rain": round(float(pop[peak]), 2),
+                "max_chance_at": _format_time(dt[peak]),
+                "mean_chance_of_rain": round(float(pop.mean()), 2),
+                "slots_likely_rain": int(likely.sum()),
+                "first_likely_rain": _format_time(dt[likely][0]) if likely.any() else None,
+            }
+        )
+    elif intent == "max":
+        temp_max = table.columns["temp_max"][mask]
+        peak = int(np.argmax(temp_max))
+        facts.update({"max_temp_c": float(temp_max[peak]), "at": _format_time(dt[peak])})
+    elif intent == "min":
+        temp_min = table.columns["temp_min"][mask]
+        low = int(np.argmin(temp_min))
+        facts.update({"min_temp_c": float(temp_min[low]), "at": _format_time(dt[low])})
+    elif intent == "mean":
+        facts.update(
+            {
+                "mean_temp_c": round(float(temp.mean()), 1),
+                "mean_humidity_pct": round(float(table.columns["humidity"][mask].mean()), 1),
+            }
+        )
+    return facts
+
+
+def numeric_answer(question, table, now=None, history=()):
+    """
+    Facts for a trend/aggregate question as {city: facts}, or None when the
+    question isn't one (or there's no data) and should go through retrieval.
+    A question without a city ("Is it getting warmer?") is about the last
+    city named in `history` (earlier messages, newest first). Failing that,
+    only the first MAX_UNNAMED_CITIES cities are reported, with a note.
+    """
+    intent = classify_question(question)
+    if intent is None or len(table) == 0:
+        return None
+    constraints = parse_query_constraints(question, table.cities(), now)
+    cities = constraints.cities
+    for text in history:
+        if cities:
+            break
+        cities = parse_query_constraints(text, table.cities(), now).cities
+    truncated = None
+    if not cities:
+        cities = [city.lower() for city in table.cities()]
+        if len(cities) > MAX_UNNAMED_CITIES:
+            truncated = (
+                f"no city was named; showing {MAX_UNNAMED_CITIES} of {len(cities)} cities, "
+                "ask about a specific city for its forecast"
+            )
+            cities = cities[:MAX_UNNAMED_CITIES]
+
+    answers = {}
+    for city in cities:
+        mask = table.select(city, constraints.start, constraints.end)
+        note = None
+        if mask.start == mask.stop and constraints.start is not None:
+            # e.g. "next week" past the end of the 5-day forecast
+            mask = table.select(city)
+            note = "forecast does not reach the requested dates; using the whole forecast"
+        if mask.start == mask.stop:
+            continue
+        facts = compute_facts(table, intent, mask)
+        if note:
+            facts["note"] = note
+        answers[str(table.city[mask.start])] = facts
+    if not answers:
+        return None
+    facts = {"intent": intent, "cities": answers}
+    if truncated:
+        facts["note"] = truncated
+    return facts
+
+
+PHRASE_PROMPT = """Answer the question about the weather forecast using only these computed facts (temperatures in °C, chance of rain from 0 to 1). Be brief.
+
+Facts: {facts}
+
+Question: {question}
+Answer:"""
+
+
+class NumericRouter:
+    """
+    Wraps the retrieval chain: aggregate questions are answered from the
+    table, everything else goes to the chain. Both share the chain's memory.
+    """
+
+    def __init__(self, chain, table, llm):
+        self.chain = chain
+        self.table = table
+        self.llm = llm
+
+    def _history(self):
+        """Earlier messages, newest first, for questions that don't name a city."""
+        memory = self.chain.memory
+        messages = getattr(getattr(memory, "chat_memory", None), "messages", [])
+        history = [message.content for message in reversed(messages)]
+        if getattr(memory, "summary", ""):
+            history.append(memory.summary)
+        return history
+
+    def _facts(self, question):
+        started = time.perf_counter()
+        facts = numeric_answer(question, self.table, history=self._history())
+        return facts, round((time.perf_counter() - started) * 1000, 3)
+
+    def _prompt(self, question, facts):
+        return PHRASE_PROMPT.format(facts=json.dumps(facts), question=question)
+
+    def _result(self, question, answer, facts, compute_ms):
+        return {
+            "question": question,
+            "answer": answer,
+            "route": "numeric",
+            "facts": facts,
+            "compute_ms": compute_ms,
+        }
+
+    def invoke(self, inputs):
+        question = inputs["question"]
+        facts, compute_ms = self._facts(question)
+        if facts is None:
+            return {**self.chain.invoke(inputs), "route": "retrieval"}
+
+        answer = self.llm.invoke(self._prompt(question, facts)).strip()
+        if self.chain.memory is not None:
+            self.chain.memory.save_context({"question": question}, {"answer": answer})
+        return self._result(question, answer, facts, compute_ms)
+
+    async def ainvoke(self, inputs):
+        result = None
+        async for item in self.astream(inputs):
+            if isinstance(item, dict):
+                result = item
+        return result
+
+    async def astream(self, inputs):
+        """
+        Yield answer tokens (str) as the LLM produces them, then the same
+        result dict invoke() returns. In the retrieval route only the LLM
+        tagged ANSWER_TAG is streamed, not the question-rephrasing one.
+        """
+        question = inputs["question"]
+        facts, compute_ms = self._facts(question)
+        if facts is None:
+            result, tokens = None, []
+            async for event in self.chain.astream_events(inputs, version="v2"):
+                if event["event"] == "on_llm_stream" and ANSWER_TAG in event["tags"]:
+                    tokens.append(event["data"]["chunk"].text)
+                    yield tokens[-1]
+                elif event["event"] == "on_chain_end" and not event["parent_ids"]:
+                    result = event["data"]["output"]
+            if result is None:
+                # No root end event (e.g. a wrapped or custom chain): answer
+                # with what was streamed rather than failing after the fact
+                result = {"question": question, "answer": "".join(tokens).strip()}
+            yield {**result, "route": "retrieval"}
+            return
+
+        parts = []
+        async for token in self.llm.astream(self._prompt(question, facts)):
+            parts.append(token)
+            yield token
+        answer = "".join(parts).strip()
+        if self.chain.memory is not None:
+            await self.chain.memory.asave_context({"question": question}, {"answer": answer})
+        yield self._result(question, answer, facts, compute_ms)
@@ -4,6 +4,8 @@ from langchain.prompts import PromptTemplate
 from langchain.schema import Document
 from langchain.vectorstores import FAISS
 
+from cached_embeddings import CachedEmbeddings
+
 
 def main():
     print("Hello World - LangChain Example")
@@ -26,8 +28,9 @@ def main():
     print(f"Created {len(documents)} sample documents")
 
     try:
-        embeddings = OpenAIEmbeddings()
+        embeddings = CachedEmbeddings(OpenAIEmbeddings())
         vectorstore = FAISS.from_documents(documents, embeddings)
+        embeddings.save()
         print("Successfully created vector store with embeddings")
 
         retriever = vectorstore.as_retriever()
@@ -0,0 +1,104 @@
+"""
+Local stand-in for the OpenWeatherMap 5-day forecast API.
+Serves GET /forecast?q=<city> with 40 deterministic 3-hour slots per city,
+answers with an ETag and Last-Modified, and returns 304 for matching
+conditional requests, so ingestion can be exercised without an API key:
+
+    python openweather_stub.py --port 8081
+    OPENWEATHER_BASE_URL=http://127.0.0.1:8081 python forecast_ingest.py London Paris
+
+Tests can start it in-process with start_stub_server().
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SLOT_SECONDS = 3 * 60 * 60
+WEATHER = ["clear sky", "few clouds", "overcast clouds", "light rain", "moderate rain"]
+
+
+def make_forecast(city, now=None):
+    """40 slots starting at the current 3-hour boundary, stable for a given city and slot."""
+    now = time.time() if now is None else now
+    start = int(now) // SLOT_SECONDS * SLOT_SECONDS
+    rng = random.Random(f"{city.lower()}:{start}")
+    base_temp = rng.uniform(-5, 30)
+    slots = []
+    for i in range(40):
+        temp = round(base_temp + rng.uniform(-4, 4) + i * rng.uniform(-0.1, 0.1), 2)
+        slots.append(
+            {
+                "dt": start + i * SLOT_SECONDS,
+                "main": {
+                    "temp": temp,
+                    "temp_min": round(temp - rng.uniform(0, 2), 2),
+                    "temp_max": round(temp + rng.uniform(0, 2), 2),
+                    "humidity": rng.randint(30, 100),
+                },
+                "weather": [{"description": rng.choice(WEATHER)}],
+                "pop": round(rng.random(), 2),
+            }
+        )
+    return {"cod": "200", "cnt": len(slots), "list": slots, "city": {"name": city}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    requests_served = 0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.rstrip("/").split("/")[-1] != "forecast" or "q" not in query:
+            self.send_error(404)
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        type(self).requests_served += 1
+
+        body = json.dumps(make_forecast(query["q"][0])).encode("utf-8")
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(usegmt=True))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, latency=0.0):
+    """Run the stub in a background thread; returns (server, base_url)."""
+    handler = type("Handler", (StubHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub OpenWeatherMap forecast API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, args.latency)
+    print(f"Serving stub forecasts at {base_url}/forecast?q=<city>")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
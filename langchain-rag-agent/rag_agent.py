@@ -1,16 +1,36 @@
+import hashlib
 import os
+import time
 from datetime import datetime, timezone
 
 import requests
 from langchain.chains import ConversationalRetrievalChain
 from langchain.docstore.document import Document
-from langchain.memory import ConversationBufferMemory
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAI, OpenAIEmbeddings
 
+from cached_embeddings import CachedEmbeddings
+from forecast_filter import FilteredForecastRetriever
+from forecast_table import ANSWER_TAG, ForecastTable, NumericRouter
+from summary_memory import SummaryWindowMemory
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENWEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+if OPENAI_API_KEY:
+    os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+
+OPENWEATHER_BASE_URL = os.getenv(
+    "OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5"
+)
+
+# Where the FAISS index is saved between runs
+FAISS_INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "./faiss_forecasts")
+# OpenWeatherMap forecasts come in 3-hour slots
+FORECAST_SLOT_SECONDS = 3 * 60 * 60
+
+
+# Reused across calls so repeated fetches keep the connection alive
+_session = requests.Session()
 
 
 def fetch_weather_forecast(city, api_key):
@@ -18,52 +38,191 @@ def fetch_weather_forecast(city, api_key):
     Fetch Weather Data from OpenWeatherMap
     Get the 5-day forecast for a city
     """
-    url = f"https://api.openweathermap.org/data/2.5/forecast?q={city}&units=metric&appid={api_key}"
-    resp = requests.get(url)
+    resp = _session.get(
+        f"{OPENWEATHER_BASE_URL}/forecast",
+        params={"q": city, "units": "metric", "appid": api_key},
+        timeout=10,
+    )
+    resp.raise_for_status()
     data = resp.json()
     return data["list"]
 
 
-def store_forecasts_in_faiss(forecasts, city):
+def forecast_doc_id(city, dt):
+    """Stable document ID for one forecast slot, so re-fetches overwrite it."""
+    return f"{city.lower()}:{dt}"
+
+
+def forecast_to_document(forecast, city):
+    # dt = datetime.utcfromtimestamp(forecast['dt']).strftime('%Y-%m-%d %H:%M')  # Deprecated in Python 3.12
+    dt = datetime.fromtimestamp(forecast["dt"], tz=timezone.utc).strftime(
+        "%Y-%m-%d %H:%M"
+    )
+    temp = forecast["main"]["temp"]
+    weather = forecast["weather"][0]["description"]
+    page_content = f"Date: {dt}, City: {city}, Temp: {temp}°C, Weather: {weather}"
+    return Document(
+        page_content=page_content,
+        metadata={
+            "date": dt,
+            "city": city,
+            "dt": forecast["dt"],
+            "content_hash": hashlib.sha256(page_content.encode("utf-8")).hexdigest(),
+        },
+    )
+
+
+def load_faiss_index(embeddings, index_dir=FAISS_INDEX_DIR):
+    """Load the saved index, or return None on the first run."""
+    if not os.path.exists(os.path.join(index_dir, "index.faiss")):
+        return None
+    # The index is written by this script, so unpickling its docstore is safe
+    return FAISS.load_local(
+        index_dir, embeddings, allow_dangerous_deserialization=True
+    )
+
+
+def evict_expired_forecasts(vectordb, table=None, cutoff=None):
+    """
+    Drop forecast slots older than `cutoff` (by default, the slot that just
+    ended) from the index and, if given, the ForecastTable. Returns how many
+    documents were evicted from the index.
+    """
+    cutoff = time.time() - FORECAST_SLOT_SECONDS if cutoff is None else cutoff
+    expired_ids = []
+    if vectordb is not None:
+        expired_ids = [
+            doc_id
+            for doc_id in vectordb.index_to_docstore_id.values()
+            if vectordb.docstore.search(doc_id).metadata.get("dt", 0) < cutoff
+        ]
+        if expired_ids:
+            vectordb.delete(expired_ids)
+    if table is not None:
+        table.evict(cutoff)
+    return len(expired_ids)
+
+
+def store_forecasts_in_faiss(
+    forecasts,
+    city,
+    vectordb=None,
+    embeddings=None,
+    index_dir=FAISS_INDEX_DIR,
+    save=True,
+    table=None,
+):
     """
     Store Forecasts in FAISS Vector Store
-    Each forecast entry is treated as a document. We'll use LangChain's FAISS wrapper.
+    Each forecast entry is treated as a document with an ID built from (city, dt).
+    Only new or changed slots are embedded; slots already in the past are evicted.
+    The index is saved to `index_dir` so the next run can start from it; bulk
+    loaders pass save=False and call vectordb.save_local() (and the embedding
+    cache's save()) once at the end.
+    If a ForecastTable is given, the raw numbers are upserted into it too.
+    Embedding happens first, so if it fails neither the index nor the table
+    has changed.
     """
-    docs = []
+    embeddings = embeddings or CachedEmbeddings(OpenAIEmbeddings())
+    if vectordb is None:
+        vectordb = load_faiss_index(embeddings, index_dir)
+
+    cutoff = time.time() - FORECAST_SLOT_SECONDS
+    docs = {}
     for forecast in forecasts:
-        # dt = datetime.utcfromtimestamp(forecast['dt']).strftime('%Y-%m-%d %H:%M')  # Deprecated in Python 3.12
-        dt = datetime.fromtimestamp(forecast["dt"], tz=timezone.utc).strftime(
-            "%Y-%m-%d %H:%M"
+        if forecast["dt"] < cutoff:
+            continue
+        docs[forecast_doc_id(city, forecast["dt"])] = forecast_to_document(
+            forecast, city
         )
-        temp = forecast["main"]["temp"]
-        weather = forecast["weather"][0]["description"]
-        doc = Document(
-            page_content=f"Date: {dt}, City: {city}, Temp: {temp}°C, Weather: {weather}",
-            metadata={"date": dt, "city": city},
-        )
-        docs.append(doc)
-    embeddings = OpenAIEmbeddings()
-    vectordb = FAISS.from_documents(docs, embeddings)
+
+    existing_ids = set(vectordb.index_to_docstore_id.values()) if vectordb else set()
+    changed_ids = []
+    for doc_id, doc in docs.items():
+        if doc_id in existing_ids:
+            stored = vectordb.docstore.search(doc_id)
+            if stored.metadata.get("content_hash") == doc.metadata["content_hash"]:
+                continue
+        changed_ids.append(doc_id)
+
+    changed_docs = [docs[doc_id] for doc_id in changed_ids]
+    texts = [doc.page_content for doc in changed_docs]
+    vectors = embeddings.embed_documents(texts) if texts else []
+
+    evicted = evict_expired_forecasts(vectordb, table, cutoff)
+    replaced_ids = set(changed_ids) & existing_ids
+    if replaced_ids:
+        vectordb.delete(list(replaced_ids))
+    if changed_docs:
+        text_embeddings = list(zip(texts, vectors))
+        metadatas = [doc.metadata for doc in changed_docs]
+        if vectordb is None:
+            vectordb = FAISS.from_embeddings(
+                text_embeddings, embeddings, metadatas=metadatas, ids=changed_ids
+            )
+        else:
+            vectordb.add_embeddings(text_embeddings, metadatas=metadatas, ids=changed_ids)
+    if table is not None:
+        table.upsert(city, forecasts, cutoff)
+        if save:
+            table.save(index_dir)
+
+    print(
+        f"{city}: embedded {len(changed_ids)} new/changed forecasts, "
+        f"kept {len(docs) - len(changed_ids)}, evicted {evicted} expired"
+    )
+    if save and vectordb is not None and (evicted or changed_ids):
+        vectordb.save_local(index_dir)
+    if save and changed_ids and isinstance(embeddings, CachedEmbeddings):
+        embeddings.save()
     return vectordb
 
 
-def build_agent(vectordb):
+def build_agent(
+    vectordb,
+    table=None,
+    memory=None,
+    llm=None,
+    question_llm=None,
+    retriever=None,
+):
     """
     Create a RetrievalQA Chain with Memory
     We'll use LangChain's RetrievalQA with memory to allow multi-step queries.
+    With a ForecastTable, trend/min/max/rain questions are computed from the
+    table and only phrased by the LLM.
+    Memory keeps the last few turns plus a summary of older ones; pass one
+    per user (see SessionMemoryStore) when serving several conversations.
+    A server builds the LLMs and retriever once and passes them in, so each
+    new session only costs a fresh chain and memory. `question_llm` rewrites
+    follow-ups into standalone questions; it defaults to `llm`.
     """
-    retriever = vectordb.as_retriever()
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-    llm = OpenAI(temperature=0)
-    qa = ConversationalRetrievalChain.from_llm(llm, retriever, memory=memory)
+    # Narrows the search to the city/dates named in the question, if any
+    retriever = retriever or FilteredForecastRetriever(vectordb=vectordb)
+    llm = llm or OpenAI(temperature=0, tags=[ANSWER_TAG])
+    if memory is None:
+        memory = SummaryWindowMemory(llm=question_llm or llm)
+    qa = ConversationalRetrievalChain.from_llm(
+        llm, retriever, memory=memory, condense_question_llm=question_llm
+    )
+    if table is not None:
+        return NumericRouter(qa, table, llm)
     return qa
 
 
 if __name__ == "__main__":
     city = "London"
     forecasts = fetch_weather_forecast(city, OPENWEATHER_API_KEY)
-    vectordb = store_forecasts_in_faiss(forecasts, city)
-    agent = build_agent(vectordb)
+    embeddings = CachedEmbeddings(OpenAIEmbeddings())
+    table = ForecastTable.load(FAISS_INDEX_DIR)
+    vectordb = store_forecasts_in_faiss(
+        forecasts,
+        city,
+        vectordb=load_faiss_index(embeddings),
+        embeddings=embeddings,
+        table=table,
+    )
+    agent = build_agent(vectordb, table)
 
     # Example multi-step query
     query = "What's the forecast trend for next week? Is it getting warmer or colder?"
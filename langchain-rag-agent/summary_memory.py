@@ -0,0 +1,130 @@
+"""
+Bounded conversation memory for the agent.
+The last K turns are kept word for word. Older turns are folded into a
+running summary, a few at a time, so the history sent with each follow-up
+question stays under a fixed token budget however long the session runs.
+SessionMemoryStore keeps a separate memory per session id.
+"""
+
+import threading
+import time
+from typing import Any
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import SystemMessage, get_buffer_string
+
+SUMMARY_PROMPT = """Progressively summarize a conversation about weather forecasts. Keep the cities, dates and numbers that later questions may refer back to. Use at most {max_words} words.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+
+class SummaryWindowMemory(BaseChatMemory):
+    """
+    Last `k` turns verbatim plus a rolling summary of everything before them,
+    together kept under `max_token_limit` tokens.
+    """
+
+    llm: Any
+    memory_key: str = "chat_history"
+    input_key: str = "question"
+    output_key: str = "answer"
+    return_messages: bool = True
+    k: int = 4
+    max_token_limit: int = 1000
+    summary_max_words: int = 150
+    summary: str = ""
+
+    @property
+    def memory_variables(self):
+        return [self.memory_key]
+
+    def _count_tokens(self, messages):
+        return self.llm.get_num_tokens(get_buffer_string(messages))
+
+    def _history(self):
+        messages = list(self.chat_memory.messages)
+        if self.summary:
+            messages.insert(0, SystemMessage(content=f"Summary of the earlier conversation: {self.summary}"))
+        return messages
+
+    def load_memory_variables(self, inputs):
+        messages = self._history()
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def _pop_old_turns(self):
+        """Remove the turns that no longer fit the window and return them."""
+        messages = list(self.chat_memory.messages)
+        budget = self.max_token_limit - (self.llm.get_num_tokens(self.summary) if self.summary else 0)
+        cut = 0
+        # A turn is a human/AI message pair; always keep the latest one
+        while len(messages) - cut > 2 and (
+            len(messages) - cut > 2 * self.k or self._count_tokens(messages[cut:]) > budget
+        ):
+            cut += 2
+        if not cut:
+            return []
+        self.chat_memory.clear()
+        self.chat_memory.add_messages(messages[cut:])
+        return messages[:cut]
+
+    def _summary_prompt(self, old_messages):
+        return SUMMARY_PROMPT.format(
+            max_words=self.summary_max_words,
+            summary=self.summary or "(none)",
+            new_lines=get_buffer_string(old_messages),
+        )
+
+    def save_context(self, inputs, outputs):
+        super().save_context(inputs, outputs)
+        old_messages = self._pop_old_turns()
+        if old_messages:
+            # Only the turns leaving the window are sent, never the whole history
+            result = self.llm.invoke(self._summary_prompt(old_messages))
+            self.summary = getattr(result, "content", result).strip()
+
+    async def asave_context(self, inputs, outputs):
+        await super().asave_context(inputs, outputs)
+        old_messages = self._pop_old_turns()
+        if old_messages:
+            result = await self.llm.ainvoke(self._summary_prompt(old_messages))
+            self.summary = getattr(result, "content", result).strip()
+
+    def clear(self):
+        super().clear()
+        self.summary = ""
+
+
+class SessionMemoryStore:
+    """One SummaryWindowMemory per session id, created on first use."""
+
+    def __init__(self, llm, **memory_kwargs):
+        self.llm = llm
+        self.memory_kwargs = memory_kwargs
+        self.sessions = {}
+        self.last_used = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            memory = self.sessions.get(session_id)
+            if memory is None:
+                memory = SummaryWindowMemory(llm=self.llm, **self.memory_kwargs)
+                self.sessions[session_id] = memory
+            self.last_used[session_id] = time.monotonic()
+            return memory
+
+    def drop(self, session_id):
+        with self._lock:
+            self.last_used.pop(session_id, None)
+            return self.sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self.sessions)